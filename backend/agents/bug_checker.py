@@ -5,9 +5,12 @@ duplicates, and logical inconsistencies.
 
 import json
 import re
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Set, Tuple
 
-from extractor import groq_client, MODEL
+from dedup import find_near_duplicates
+from executors import io_pool
+from limits import record_parse_failure, reserve_budget
+from llm import compact_records, complete
 
 # Same media-placeholder pattern used by ValidatorAgent
 MEDIA_PATTERNS = re.compile(
@@ -16,8 +19,19 @@ MEDIA_PATTERNS = re.compile(
     re.IGNORECASE,
 )
 
+# Record fields sent to the auditor, in row order after the id
+AUDIT_COLUMNS = [
+    "timestamp", "sender", "product", "quantity", "unit_price",
+    "total_price", "currency", "notes",
+]
+
+# Completion token cap per audit request, reserved against the job budget
+MAX_TOKENS = 4096
+
 AUDIT_PROMPT = """
 You are a data auditor reviewing a list of extracted sales records for a business.
+The input is a JSON object with "columns" and "rows"; each row is a sale record
+whose first value is its id.
 Identify any of the following issues:
 - Duplicate records (same sender, product, timestamp)
 - Prices that are suspiciously high or low compared to other records for the same product
@@ -28,21 +42,23 @@ Do NOT flag records whose product is a media placeholder such as
 "<Media omitted>", "image omitted", "video omitted", etc. — those should be silently ignored.
 
 Return a JSON object with two keys:
-- "sales": the cleaned list (remove confirmed duplicates, fix arithmetic if possible)
-- "errors": a list of objects, each with "record" (the problematic sale) and "reason" (string)
+- "remove": ids of confirmed duplicate records to drop (list of integers)
+- "errors": a list of [id, reason] pairs, one per problematic record
 
-Return ONLY the JSON object.
+Do NOT echo the records back. Return ONLY the JSON object.
 """
 
 
 class BugChecker:
     async def run(self, sales: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
-        Run local heuristic checks then deep-audit via Groq.
+        Run local heuristic checks then deep-audit via the LLM.
 
         Local checks (dedup, arithmetic) run first without an API call.
         The remaining records are then sent to the LLM auditor for duplicate
         detection, price anomalies, and cross-record inconsistencies.
+        Suspected reposts already flagged locally are kept but left out of
+        the audit, so the auditor cannot remove or flag them a second time.
 
         Args:
             sales: Validated sale dicts from ValidatorAgent.
@@ -51,35 +67,89 @@ class BugChecker:
             Dict with keys:
               sales  — cleaned list with confirmed duplicates removed
               errors — combined list of local and LLM-flagged issue dicts
+
+        Raises:
+            TokenBudgetExceeded: if the job's LLM token budget is spent.
         """
         # Fast local checks first
-        sales, local_errors = self._local_checks(sales)
-
-        if not sales:
-            return {"sales": [], "errors": local_errors}
-
-        # Deep audit via Groq
-        payload = json.dumps(sales, ensure_ascii=False)
-        response = groq_client.chat.completions.create(
-            model=MODEL,
-            max_tokens=4096,
-            reasoning_effort="none",
-            messages=[
-                {"role": "system", "content": AUDIT_PROMPT},
-                {"role": "user", "content": payload},
-            ],
-        )
+        sales, local_errors, reposts = self._local_checks(sales)
+        audited = [s for i, s in enumerate(sales) if i not in reposts]
+
+        if not audited:
+            return {"sales": sales, "errors": local_errors}
+
+        # Deep audit via the LLM routed to "auditor" — it answers with ids only
+        payload = compact_records(audited, AUDIT_COLUMNS)
+        with reserve_budget(AUDIT_PROMPT + payload, MAX_TOKENS) as reservation:
+            response = await io_pool.run(
+                complete,
+                "auditor",
+                max_tokens=MAX_TOKENS,
+                messages=[
+                    {"role": "system", "content": AUDIT_PROMPT},
+                    {"role": "user", "content": payload},
+                ],
+                json_mode=True,
+            )
+            reservation.settle(response)
 
         try:
-            result = json.loads(response.choices[0].message.content)
-            result["errors"] = local_errors + result.get("errors", [])
-            return result
-        except json.JSONDecodeError:
+            verdict = json.loads(response.content)
+            result = self._rehydrate(verdict, audited, local_errors)
+        except (json.JSONDecodeError, AttributeError, TypeError):
+            record_parse_failure("auditor")
             return {
                 "sales": sales,
                 "errors": local_errors + [{"reason": "BugChecker LLM response could not be parsed."}],
             }
 
+        # Put the locally flagged reposts back in their original positions
+        kept = {id(s) for s in result["sales"]}
+        result["sales"] = [s for i, s in enumerate(sales) if i in reposts or id(s) in kept]
+        return result
+
+    def _rehydrate(
+        self, verdict: Dict[str, Any], sales: List[Dict[str, Any]], local_errors: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Turn the auditor's id-only verdict back into sales and error records.
+
+        Args:
+            verdict:      Parsed auditor response with "remove" and "errors" keys.
+            sales:        Records that were sent, indexed by id.
+            local_errors: Errors already raised by the local checks.
+
+        Returns:
+            Dict with keys sales (records minus removed ids) and errors.
+        """
+        remove = {i for i in verdict.get("remove", []) if isinstance(i, int)}
+        errors = list(local_errors)
+        for entry in verdict.get("errors", []):
+            if not isinstance(entry, list) or len(entry) < 2:
+                continue
+            idx, reason = entry[0], str(entry[1])
+            if isinstance(idx, int) and 0 <= idx < len(sales):
+                errors.append({"record": sales[idx], "reason": reason})
+            else:
+                errors.append({"reason": reason})
+        return {
+            "sales": [s for i, s in enumerate(sales) if i not in remove],
+            "errors": errors,
+        }
+
+    def run_local(self, sales: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Run only the local heuristic checks, skipping the LLM audit.
+
+        Args:
+            sales: Validated sale dicts.
+
+        Returns:
+            Dict with keys sales and errors, as returned by run().
+        """
+        clean, errors, _ = self._local_checks(sales)
+        return {"sales": clean, "errors": errors}
+
     def _is_media_only(self, sale: Dict[str, Any]) -> bool:
         """
         Return True when the sale record originates from a media-placeholder message.
@@ -103,7 +173,7 @@ class BugChecker:
 
     def _local_checks(
         self, sales: List[Dict[str, Any]]
-    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Set[int]]:
         """
         Apply fast, deterministic checks without calling the LLM.
 
@@ -113,12 +183,17 @@ class BugChecker:
           3. Flag arithmetic mismatches where qty × unit_price diverges from
              total_price by more than 5%, and auto-correct total_price.
           4. Flag records with a real product but no price or quantity at all.
+          5. Flag suspected reposts (same sender, quantity and price, similar
+             wording, within dedup.REPOST_WINDOW) found via the local
+             MinHash/LSH index. They are kept, since a repeat sale at a
+             fixed list price looks the same.
 
         Args:
             sales: Full list of validated sale dicts.
 
         Returns:
-            Tuple of (clean_sales, error_list).
+            Tuple of (clean_sales, error_list, repost_indexes), where
+            repost_indexes are the positions in clean_sales of suspected reposts.
         """
         seen: set = set()
         clean: List[Dict[str, Any]] = []
@@ -160,4 +235,16 @@ class BugChecker:
 
             clean.append(sale)
 
-        return clean, errors
+        # Near-duplicate pass — flag suspected reposts for review, keep the records
+        reposts = find_near_duplicates(clean)
+        for idx, canonical in reposts.items():
+            original = clean[canonical]
+            errors.append({
+                "record": clean[idx],
+                "reason": (
+                    "Suspected repost of the sale at "
+                    f"{original.get('timestamp')} ({original.get('product')}); kept for review."
+                ),
+            })
+
+        return clean, errors, set(reposts)
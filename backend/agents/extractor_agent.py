@@ -1,29 +1,38 @@
 """
-ExtractorAgent: uses Groq (qwen/qwen3-32b) to extract structured sale records
-from pre-filtered WhatsApp messages.
+ExtractorAgent: uses the LLM routed to "extractor" (see llm.py) to extract
+structured sale records from pre-filtered WhatsApp messages.
 """
 
 import json
 from typing import List, Dict, Any
 
-from extractor import groq_client, MODEL, extract_sales_candidates
+from executors import io_pool
+from extractor import extract_sales_candidates
+from limits import record_parse_failure, reserve_budget
+from llm import complete
+
+# Positional layout of each row in the compact extractor response
+ROW_FIELDS = ["product", "quantity", "unit_price", "total_price", "currency", "notes"]
+
+# Completion token cap per extraction request, reserved against the job budget
+MAX_TOKENS = 4096
 
 SYSTEM_PROMPT = """
-You are a sales data extraction specialist. Your job is to read WhatsApp chat messages
-and extract structured sale records from them.
+You are a sales data extraction specialist. Your job is to read numbered WhatsApp chat
+messages (#1, #2, ...) and extract structured sale records from them.
 
-For each sale found, return a JSON object with these fields:
-- timestamp: the message timestamp (string)
-- sender: who sent the message (string)
+For each sale found, return one positional row array:
+  [n, product, quantity, unit_price, total_price, currency, notes]
+- n: number of the message the sale comes from (integer)
 - product: product name or description (string)
 - quantity: numeric quantity (number or null)
 - unit_price: price per unit (number or null)
 - total_price: total price of the transaction (number or null)
 - currency: currency code or symbol detected (string or null)
-- notes: any relevant extra info (string)
+- notes: any relevant extra info (string, "" if none)
 
-Return a JSON array of sale objects. If no sales are found, return an empty array [].
-Do NOT include any text outside the JSON array.
+Return a JSON object {"sales": [row, ...]}. If no sales are found, return {"sales": []}.
+Do NOT include any text outside the JSON object.
 """
 
 
@@ -33,7 +42,7 @@ class ExtractorAgent:
         Extract structured sale records from a list of parsed message dicts.
 
         Uses a rule-based pre-filter (regex for prices/quantities) to narrow
-        the message set before sending batches of 30 to the Groq LLM, minimising
+        the message set before sending batches of 30 to the LLM, minimising
         API cost and latency. Failed JSON parses are silently skipped; the
         BugChecker agent will flag any resulting gaps.
 
@@ -43,7 +52,19 @@ class ExtractorAgent:
         Returns:
             List of raw sale dicts as returned by the LLM (unvalidated).
         """
-        # Rule-based pre-filter to reduce API calls
+        return await self.extract(self.prefilter(messages))
+
+    def prefilter(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Apply the rule-based pre-filter (regex for prices/quantities).
+
+        Args:
+            messages: List of message dicts as produced by ParserAgent.
+
+        Returns:
+            Candidate dicts with keys timestamp, sender, text, hint_prices,
+            hint_quantities — one per message that likely mentions a sale.
+        """
         from parser import Message
         raw_messages = [
             Message(
@@ -55,8 +76,22 @@ class ExtractorAgent:
             for m in messages
             if not m.get("is_system", False)
         ]
-        candidates = extract_sales_candidates(raw_messages)
+        return extract_sales_candidates(raw_messages)
+
+    async def extract(self, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Send pre-filtered candidate messages to the LLM in batches of 30.
+
+        Args:
+            candidates: Candidate dicts from prefilter(), optionally narrowed
+                        further by ParserAgent.classify_messages.
 
+        Returns:
+            List of raw sale dicts as returned by the LLM (unvalidated).
+
+        Raises:
+            TokenBudgetExceeded: if the job's LLM token budget is spent.
+        """
         if not candidates:
             return []
 
@@ -66,22 +101,56 @@ class ExtractorAgent:
 
         for batch in batches:
             batch_text = "\n---\n".join(
-                f"[{c['timestamp']}] {c['sender']}: {c['text']}" for c in batch
-            )
-            response = groq_client.chat.completions.create(
-                model=MODEL,
-                max_tokens=4096,
-                reasoning_effort="none",
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": batch_text},
-                ],
+                f"#{n} [{c['timestamp']}] {c['sender']}: {c['text']}" for n, c in enumerate(batch, start=1)
             )
+            with reserve_budget(SYSTEM_PROMPT + batch_text, MAX_TOKENS) as reservation:
+                response = await io_pool.run(
+                    complete,
+                    "extractor",
+                    max_tokens=MAX_TOKENS,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": batch_text},
+                    ],
+                    json_mode=True,
+                )
+                reservation.settle(response)
             try:
-                sales = json.loads(response.choices[0].message.content)
-                if isinstance(sales, list):
-                    all_sales.extend(sales)
-            except json.JSONDecodeError:
-                pass  # BugChecker will flag this batch
+                rows = json.loads(response.content).get("sales", [])
+            except (json.JSONDecodeError, AttributeError):
+                rows = None
+            if not isinstance(rows, list):
+                record_parse_failure("extractor")  # Batch is skipped; the result is partial
+                continue
+            all_sales.extend(self._rehydrate(rows, batch))
 
         return all_sales
+
+    def _rehydrate(self, rows: List[Any], batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Expand compact positional rows into full sale dicts.
+
+        Timestamp and sender are taken from the referenced message rather than
+        echoed by the LLM. Rows that are malformed or reference an unknown
+        message number are skipped.
+
+        Args:
+            rows:  Row arrays [n, product, quantity, unit_price, total_price, currency, notes].
+            batch: Candidate dicts the message numbers refer to (1-based).
+
+        Returns:
+            List of sale dicts with the usual ExtractorAgent keys.
+        """
+        sales = []
+        for row in rows:
+            if not isinstance(row, list) or not row or not isinstance(row[0], int):
+                continue
+            if not 1 <= row[0] <= len(batch):
+                continue
+            source = batch[row[0] - 1]
+            values = row[1:] + [None] * (len(ROW_FIELDS) - len(row) + 1)
+            sale = {"timestamp": source["timestamp"], "sender": source["sender"]}
+            sale.update(zip(ROW_FIELDS, values))
+            sale["notes"] = sale["notes"] or ""
+            sales.append(sale)
+        return sales
@@ -4,26 +4,69 @@ Orchestrator: coordinates the full pipeline.
 Pipeline:
   raw text
     → ParserAgent   (structure messages)
+    → ExtractorAgent.prefilter (regex price/quantity candidates)
+    → ParserAgent.classify_messages (drop non-sales candidates, cached)
     → ExtractorAgent (identify sale records)
     → ValidatorAgent (clean & validate fields)
     → BugChecker    (flag anomalies / inconsistencies)
     → final result
+
+Every run is bounded by JobLimits (see limits.py). Depending on LIMIT_MODE an
+oversized job is rejected, truncated to its most recent messages, or degraded
+to local rule-based extraction.
 """
 
-from typing import Any, Dict
-from agents.parser_agent import ParserAgent
+from typing import Any, Dict, List, Optional
+from agents.parser_agent import ParserAgent, format_message
 from agents.extractor_agent import ExtractorAgent
 from agents.validator_agent import ValidatorAgent
 from agents.bug_checker import BugChecker
+from executors import cpu_pool
+from extractor import candidates_to_sales
+from llm import router
+from numeric import detect_decimal_separator
+from limits import (
+    DEFAULT_LIMITS,
+    JobBudget,
+    JobLimits,
+    LimitExceeded,
+    TokenBudgetExceeded,
+    current_budget,
+    estimate_tokens,
+)
+
+# Bump whenever a change alters pipeline output, so cached upload results expire
+PIPELINE_VERSION = "3"
 
 
 class Orchestrator:
-    def __init__(self):
-        """Instantiate all four pipeline agents."""
+    def __init__(self, limits: Optional[JobLimits] = None):
+        """
+        Instantiate all four pipeline agents.
+
+        Args:
+            limits: Per-job resource limits. Defaults to the env-configured limits.
+        """
         self.parser = ParserAgent()
         self.extractor = ExtractorAgent()
         self.validator = ValidatorAgent()
         self.bug_checker = BugChecker()
+        self.limits = limits or DEFAULT_LIMITS
+
+    def fingerprint(self) -> str:
+        """
+        Describe the pipeline version and output-affecting configuration.
+
+        Used as part of the upload cache key so cached results are not reused
+        across deployments with different limits, LLM routes or catalogues.
+        """
+        catalogue = self.validator.catalogue
+        return repr((
+            PIPELINE_VERSION,
+            self.limits,
+            sorted(router.routes.items()),
+            len(catalogue) if catalogue else 0,
+        ))
 
     async def run(self, raw_text: str, filename: str = "") -> Dict[str, Any]:
         """
@@ -38,20 +81,88 @@ class Orchestrator:
               filename        — original filename
               sales           — list of validated sale dicts
               errors          — list of flagged issue dicts
-              stats           — message_parsed, candidates_found, valid_sales, flagged_errors counts
+              stats           — message_parsed, candidates_found, valid_sales, flagged_errors counts,
+                                plus classifier counters, the estimated extractor
+                                tokens saved by dropping non-sales messages (gross,
+                                and net of the classifier's own tokens),
+                                llm_tokens_used, per-agent llm_calls (calls, tokens,
+                                completion_tokens, seconds), per-agent counts of
+                                unparseable LLM responses (llm_parse_failures) and a
+                                list of degraded limits
+
+        Raises:
+            LimitExceeded:       if the job is too large and LIMIT_MODE is "reject".
+            TokenBudgetExceeded: if the LLM token budget runs out and LIMIT_MODE
+                                 is not "local".
         """
+        limits = self.limits
+        if len(raw_text.encode("utf-8")) > limits.max_bytes:
+            raise LimitExceeded(f"Upload exceeds the {limits.max_bytes}-byte limit.")
+
+        budget = JobBudget(limits.max_llm_tokens)
+        token = current_budget.set(budget)
+        try:
+            return await self._run(raw_text, filename, limits, budget)
+        finally:
+            current_budget.reset(token)
+
+    async def _run(
+        self, raw_text: str, filename: str, limits: JobLimits, budget: JobBudget
+    ) -> Dict[str, Any]:
+        """Run the pipeline under an already-installed token budget."""
+        degraded: List[str] = []
+
         # Step 1: Parse raw WhatsApp text into messages
         messages = await self.parser.run(raw_text)
+        if len(messages) > limits.max_messages:
+            if limits.mode == "reject":
+                raise LimitExceeded(f"Chat has {len(messages)} messages; the limit is {limits.max_messages}.")
+            messages = messages[-limits.max_messages:]
+            degraded.append(f"max_messages: kept the most recent {limits.max_messages} messages")
+
+        # Step 2: Regex pre-filter, then drop candidates the classifier rejects
+        prefiltered = await cpu_pool.run(self.extractor.prefilter, messages)
+        decimal_sep = detect_decimal_separator(m["text"] for m in prefiltered)
+        local_only = False
+        if len(prefiltered) > limits.max_candidates:
+            if limits.mode == "reject":
+                raise LimitExceeded(
+                    f"Chat has {len(prefiltered)} sale candidates; the limit is {limits.max_candidates}."
+                )
+            if limits.mode == "local":
+                local_only = True
+                degraded.append("max_candidates: extracted locally without the LLM")
+            else:
+                prefiltered = prefiltered[-limits.max_candidates:]
+                degraded.append(f"max_candidates: kept the most recent {limits.max_candidates} candidates")
 
-        # Step 2: Extract candidate sale records from messages
-        candidates = await self.extractor.run(messages)
+        classifier_stats: Dict[str, int] = {}
+        dropped: List[Dict[str, Any]] = []
+        if local_only:
+            candidates, result = self._run_local(prefiltered, decimal_sep)
+        else:
+            try:
+                await self.parser.classify_messages(prefiltered, stats=classifier_stats)
+                sale_messages = [m for m in prefiltered if m.get("is_sale_related", True)]
+                dropped = [m for m in prefiltered if not m.get("is_sale_related", True)]
 
-        # Step 3: Validate and normalise each candidate
-        validated = await self.validator.run(candidates)
+                # Step 3: Extract candidate sale records from the remaining messages
+                candidates = await self.extractor.extract(sale_messages)
 
-        # Step 4: Check for bugs / anomalies across the full set
-        result = await self.bug_checker.run(validated)
+                # Step 4: Validate and normalise each candidate
+                validated = await self.validator.run(candidates, decimal_sep)
 
+                # Step 5: Check for bugs / anomalies across the full set
+                result = await self.bug_checker.run(validated)
+            except TokenBudgetExceeded:
+                if limits.mode != "local":
+                    raise
+                degraded.append("max_llm_tokens: extracted locally without the LLM")
+                dropped = []
+                candidates, result = self._run_local(prefiltered, decimal_sep)
+
+        tokens_saved = sum(estimate_tokens(format_message(m)) for m in dropped)
+        classifier_tokens = budget.per_agent.get("classifier", {}).get("tokens", 0)
         return {
             "filename": filename,
             "sales": result["sales"],
@@ -61,5 +172,29 @@ class Orchestrator:
                 "candidates_found": len(candidates),
                 "valid_sales": len(result["sales"]),
                 "flagged_errors": len(result["errors"]),
+                "messages_prefiltered": len(prefiltered),
+                "messages_dropped_as_non_sales": len(dropped),
+                "extractor_tokens_saved": tokens_saved,
+                "extractor_tokens_saved_net": tokens_saved - classifier_tokens,
+                **classifier_stats,
+                "llm_tokens_used": budget.used,
+                "llm_calls": budget.per_agent,
+                "llm_parse_failures": budget.parse_failures,
+                "degraded": degraded,
             },
         }
+
+    def _run_local(self, prefiltered: List[Dict[str, Any]], decimal_sep: Optional[str] = None):
+        """
+        Degraded pipeline: rule-based extraction, local validation and checks only.
+
+        Args:
+            prefiltered: Regex candidates from ExtractorAgent.prefilter.
+            decimal_sep: The chat's decimal separator, for ambiguous numbers.
+
+        Returns:
+            Tuple of (extracted sale dicts, BugChecker-style result dict).
+        """
+        candidates = candidates_to_sales(prefiltered, decimal_sep)
+        validated = self.validator.run_local(candidates, decimal_sep)
+        return candidates, self.bug_checker.run_local(validated)
@@ -1,27 +1,73 @@
 """
-ParserAgent: wraps the rule-based parser and enriches messages with
-basic metadata (language hint, message type) using the Groq API.
+ParserAgent: wraps the rule-based parser and classifies candidate messages
+as sale-related or not using the routed LLM, so non-sales chatter is dropped
+before the more expensive ExtractorAgent call.
 """
 
+import asyncio
 import json
-from typing import List, Dict, Any
+import logging
+import re
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
 
-from extractor import groq_client, MODEL
+from executors import cpu_pool, io_pool
+from limits import reserve_budget
+from llm import complete
 from parser import parse_chat, Message
 
+logger = logging.getLogger(__name__)
+
+# Messages per classifier request and number of requests in flight at once
+CLASSIFY_BATCH_SIZE = 50
+CLASSIFY_CONCURRENCY = 4
+
+# Completion token cap per classifier request, reserved against the job budget
+CLASSIFY_MAX_TOKENS = 1024
+
+# Maximum number of normalised message texts whose verdict is remembered
+CLASSIFY_CACHE_SIZE = 10_000
+
+CLASSIFY_PROMPT = (
+    "You are a sales data classifier. "
+    "Given a list of numbered WhatsApp messages (#1, #2, ...) separated by '---', "
+    "return a JSON object {\"sale\": [n, ...]} listing only the numbers of the "
+    "messages related to a sale (product, price, quantity, order, payment). "
+    "Return ONLY the JSON object, no explanation."
+)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_message_text(text: str) -> str:
+    """Lowercase and collapse whitespace so reposted messages share a cache key."""
+    return _WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+def format_message(m: Dict[str, Any]) -> str:
+    """Render a message the way it is sent to the LLM."""
+    return f"[{m['timestamp']}] {m['sender']}: {m['text']}"
+
 
 class ParserAgent:
+    def __init__(self):
+        """Create the agent with an empty classification cache."""
+        self._verdicts: "OrderedDict[str, bool]" = OrderedDict()
+
     async def run(self, raw_text: str) -> List[Dict[str, Any]]:
         """
         Parse raw WhatsApp export text into a list of message dicts.
 
+        Parsing runs on the shared CPU pool so large exports do not block the
+        event loop.
+
         Args:
             raw_text: Full string contents of the .txt export file.
 
         Returns:
             List of dicts with keys: timestamp, sender, text, is_system.
         """
-        messages = parse_chat(raw_text)
+        messages = await cpu_pool.run(parse_chat, raw_text)
         return [self._to_dict(m) for m in messages]
 
     def _to_dict(self, msg: Message) -> Dict[str, Any]:
@@ -41,42 +87,129 @@ class ParserAgent:
             "is_system": msg.is_system,
         }
 
-    async def classify_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    async def classify_messages(
+        self, messages: List[Dict[str, Any]], stats: Optional[Dict[str, int]] = None
+    ) -> List[Dict[str, Any]]:
         """
-        Optional: use Groq to classify a batch of messages as sale-related or not.
-        Call this when rule-based heuristics produce too many false positives.
+        Flag each message with is_sale_related using cached verdicts and the LLM.
+
+        Verdicts are cached by normalised message text, so recurring greetings
+        and reposted price lists are answered without an API call. The
+        remaining messages are deduplicated and classified in concurrent
+        batches of CLASSIFY_BATCH_SIZE. If a batch fails, its messages are kept
+        (is_sale_related=True) and the failure is logged.
+
+        Args:
+            messages: Message or candidate dicts with timestamp, sender, text.
+            stats:    Optional dict updated with classifier_cache_hits,
+                      classifier_batches and classifier_failed_batches counts.
+
+        Returns:
+            The same dicts, each with an added is_sale_related bool.
         """
+        if stats is None:
+            stats = {}
+        for counter in ("classifier_cache_hits", "classifier_batches", "classifier_failed_batches"):
+            stats.setdefault(counter, 0)
         if not messages:
             return messages
 
-        batch_text = "\n---\n".join(
-            f"[{m['timestamp']}] {m['sender']}: {m['text']}" for m in messages[:50]
-        )
-
-        response = groq_client.chat.completions.create(
-            model=MODEL,
-            max_tokens=1024,
-            reasoning_effort="none",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a sales data classifier. "
-                        "Given a list of WhatsApp messages separated by '---', "
-                        "return a JSON array where each element is true if the corresponding "
-                        "message is related to a sale (product, price, quantity, order, payment) "
-                        "or false otherwise. Return ONLY the JSON array, no explanation."
-                    ),
-                },
-                {"role": "user", "content": batch_text},
-            ],
-        )
+        pending: Dict[str, Dict[str, Any]] = {}
+        for m in messages:
+            key = normalize_message_text(m["text"])
+            if key in self._verdicts:
+                stats["classifier_cache_hits"] += 1
+            else:
+                pending.setdefault(key, m)
+
+        keys = list(pending)
+        batches = [keys[i:i + CLASSIFY_BATCH_SIZE] for i in range(0, len(keys), CLASSIFY_BATCH_SIZE)]
+        semaphore = asyncio.Semaphore(CLASSIFY_CONCURRENCY)
 
+        async def classify(batch_keys: List[str]) -> Tuple[List[str], Optional[List[bool]]]:
+            async with semaphore:
+                flags = await io_pool.run(
+                    self._classify_batch, [pending[k] for k in batch_keys]
+                )
+            return batch_keys, flags
+
+        tasks = [asyncio.ensure_future(classify(b)) for b in batches]
         try:
-            flags = json.loads(response.choices[0].message.content)
-            for msg, flag in zip(messages, flags):
-                msg["is_sale_related"] = bool(flag)
-        except Exception:
-            pass  # Fall back to keeping all messages
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # e.g. TokenBudgetExceeded: stop the other batches and collect their outcomes
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        stats["classifier_batches"] += len(batches)
+
+        fresh: Dict[str, bool] = {}
+        for batch_keys, flags in results:
+            if flags is None:
+                stats["classifier_failed_batches"] += 1
+                continue
+            for key, flag in zip(batch_keys, flags):
+                fresh[key] = flag
+                self._remember(key, flag)
+
+        for m in messages:
+            key = normalize_message_text(m["text"])
+            verdict = fresh.get(key)
+            if verdict is None:
+                verdict = self._lookup(key)
+            m["is_sale_related"] = True if verdict is None else verdict
 
         return messages
+
+    def _classify_batch(self, batch: List[Dict[str, Any]]) -> Optional[List[bool]]:
+        """
+        Classify one batch with a blocking LLM call.
+
+        Args:
+            batch: Up to CLASSIFY_BATCH_SIZE message dicts.
+
+        Returns:
+            One bool per message, or None if the call or response parsing failed.
+
+        Raises:
+            TokenBudgetExceeded: if the job's LLM token budget is spent.
+        """
+        batch_text = "\n---\n".join(f"#{n} {format_message(m)}" for n, m in enumerate(batch, start=1))
+        reservation = reserve_budget(CLASSIFY_PROMPT + batch_text, CLASSIFY_MAX_TOKENS)
+        try:
+            with reservation:
+                response = complete(
+                    "classifier",
+                    max_tokens=CLASSIFY_MAX_TOKENS,
+                    messages=[
+                        {"role": "system", "content": CLASSIFY_PROMPT},
+                        {"role": "user", "content": batch_text},
+                    ],
+                    json_mode=True,
+                )
+                reservation.settle(response)
+            sale_numbers = json.loads(response.content)["sale"]
+        except Exception:
+            logger.warning("Message classification failed for a batch of %d", len(batch), exc_info=True)
+            return None
+
+        if not isinstance(sale_numbers, list):
+            logger.warning("Classifier returned no sale list for %d messages; keeping the batch", len(batch))
+            return None
+        sale_set = {n for n in sale_numbers if isinstance(n, int)}
+        return [n in sale_set for n in range(1, len(batch) + 1)]
+
+    def _lookup(self, key: str) -> Optional[bool]:
+        """Return the cached verdict for a normalised text, refreshing its LRU position."""
+        verdict = self._verdicts.get(key)
+        if verdict is not None:
+            self._verdicts.move_to_end(key)
+        return verdict
+
+    def _remember(self, key: str, verdict: bool) -> None:
+        """Store a verdict, evicting the least recently used entry when full."""
+        self._verdicts[key] = verdict
+        self._verdicts.move_to_end(key)
+        if len(self._verdicts) > CLASSIFY_CACHE_SIZE:
+            self._verdicts.popitem(last=False)
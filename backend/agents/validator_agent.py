@@ -1,13 +1,17 @@
 """
 ValidatorAgent: cleans, normalises, and validates extracted sale records.
-Uses Groq (qwen/qwen3-32b) to fix ambiguous or incomplete records.
+Uses the LLM routed to "validator" (see llm.py) to fix ambiguous or incomplete records.
 """
 
 import json
 import re
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 
-from extractor import groq_client, MODEL
+from catalogue import ProductCatalogue, load_default_catalogue
+from executors import io_pool
+from limits import record_parse_failure, reserve_budget
+from llm import compact_records, complete
+from numeric import normalize_currency, parse_amount
 
 REQUIRED_FIELDS = ["timestamp", "sender", "product"]
 NUMERIC_FIELDS = ["quantity", "unit_price", "total_price"]
@@ -19,20 +23,43 @@ MEDIA_PATTERNS = re.compile(
     re.IGNORECASE,
 )
 
+# Record fields sent to the LLM, in row order after the id
+RECORD_COLUMNS = [
+    "timestamp", "sender", "product", "quantity", "unit_price",
+    "total_price", "currency", "notes", "sku",
+]
+
+# Completion token cap per repair request, reserved against the job budget
+MAX_TOKENS = 4096
+
 FIX_PROMPT = """
-You are a data quality specialist. The following JSON objects are sale records that
-may have missing or inconsistent fields. For each record:
+You are a data quality specialist. The input is a JSON object with "columns" and
+"rows"; each row is a sale record whose first value is its id. Records may have
+missing or inconsistent fields. For each record:
 1. Infer missing numeric fields if they can be derived (e.g. total = quantity × unit_price).
 2. Standardise currency to a 3-letter ISO code (BRL, USD, EUR, etc.) where possible.
-3. Keep the product description concise but descriptive.
+3. Keep the product description concise but descriptive. If a record has a "sku"
+   value, its product name is already canonical — keep it unchanged.
 4. Do not invent data — leave a field null if it truly cannot be inferred.
 
-Return a JSON array of corrected records. Return ONLY the JSON array.
+Return a JSON object {"fixes": {"<id>": {"<field>": value, ...}, ...}} containing
+ONLY the fields you changed, keyed by record id. Omit records you did not change.
+Return ONLY the JSON object.
 """
 
 
 class ValidatorAgent:
-    async def run(self, sales: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def __init__(self, catalogue: Optional[ProductCatalogue] = None):
+        """
+        Args:
+            catalogue: Product catalogue used to canonicalise product names.
+                       Defaults to the file named by PRODUCT_CATALOGUE, if any.
+        """
+        self.catalogue = catalogue if catalogue is not None else load_default_catalogue()
+
+    async def run(
+        self, sales: List[Dict[str, Any]], decimal_sep: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """
         Validate and normalise a list of raw sale records.
 
@@ -40,28 +67,49 @@ class ValidatorAgent:
         then merges the results.
 
         Args:
-            sales: Raw sale dicts from ExtractorAgent.
+            sales:       Raw sale dicts from ExtractorAgent.
+            decimal_sep: The chat's decimal separator, for ambiguous numbers.
 
         Returns:
             Combined list of clean and LLM-repaired sale dicts that pass
             all required-field checks.
         """
-        clean, needs_fix = self._split(sales)
-        fixed = await self._fix_with_groq(needs_fix) if needs_fix else []
-        return clean + fixed
+        clean, needs_fix = self._split(sales, decimal_sep)
+        fixed = await self._fix_with_llm(needs_fix) if needs_fix else []
+        return clean + [self._canonicalise_product(s) for s in fixed]
+
+    def run_local(
+        self, sales: List[Dict[str, Any]], decimal_sep: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Validate sale records without calling the LLM.
+
+        Records that would need LLM repair are discarded.
+
+        Args:
+            sales:       Raw sale dicts.
+            decimal_sep: The chat's decimal separator, for ambiguous numbers.
+
+        Returns:
+            Records that pass local coercion and required-field checks.
+        """
+        clean, _ = self._split(sales, decimal_sep)
+        return clean
 
     def _split(
-        self, sales: List[Dict[str, Any]]
+        self, sales: List[Dict[str, Any]], decimal_sep: Optional[str] = None
     ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
         """
         Partition sales into clean records and those requiring LLM repair.
 
         Media-only placeholders are silently discarded here. Numeric fields
-        are coerced before the validity check so that string prices from the
-        LLM do not cause false negatives.
+        are coerced and product names mapped to the catalogue before the
+        validity check so that string prices from the LLM do not cause false
+        negatives.
 
         Args:
-            sales: Raw sale dicts to partition.
+            sales:       Raw sale dicts to partition.
+            decimal_sep: The chat's decimal separator, for ambiguous numbers.
 
         Returns:
             Tuple of (clean_records, records_needing_fix).
@@ -71,7 +119,8 @@ class ValidatorAgent:
             # Silently drop media-only placeholders — nothing to extract
             if self._is_media_only(sale):
                 continue
-            sale = self._coerce_numerics(sale)
+            sale = self._coerce_numerics(sale, decimal_sep)
+            sale = self._canonicalise_product(sale)
             if self._is_valid(sale):
                 clean.append(sale)
             else:
@@ -92,15 +141,19 @@ class ValidatorAgent:
         has_any_numeric = any(sale.get(f) for f in NUMERIC_FIELDS)
         return not has_product and not has_any_numeric
 
-    def _coerce_numerics(self, sale: Dict[str, Any]) -> Dict[str, Any]:
+    def _coerce_numerics(self, sale: Dict[str, Any], decimal_sep: Optional[str] = None) -> Dict[str, Any]:
         """
         Convert any string-typed numeric fields to float in-place.
 
-        Handles comma-as-decimal and currency prefix stripping (e.g. "R$12,50").
-        Sets the field to None if conversion fails.
+        Uses the locale-aware parser in numeric.py: both separator conventions,
+        currency symbols/codes (e.g. "R$12,50", "AED 1,250.00"), "k"/"mil"
+        multipliers and Arabic-Indic digits. A currency found in a numeric
+        field fills a missing currency, and the currency is normalised to its
+        ISO code. Sets a field to None if conversion fails.
 
         Args:
-            sale: Sale dict to mutate.
+            sale:        Sale dict to mutate.
+            decimal_sep: The chat's decimal separator, for ambiguous numbers.
 
         Returns:
             The same dict with numeric fields coerced.
@@ -108,10 +161,33 @@ class ValidatorAgent:
         for field in NUMERIC_FIELDS:
             val = sale.get(field)
             if isinstance(val, str):
-                try:
-                    sale[field] = float(val.replace(",", ".").replace("R$", "").strip())
-                except ValueError:
-                    sale[field] = None
+                amount = parse_amount(val, decimal_sep)
+                sale[field] = amount.value if amount else None
+                if amount and amount.currency and not sale.get("currency"):
+                    sale["currency"] = amount.currency
+        if isinstance(sale.get("currency"), str):
+            sale["currency"] = normalize_currency(sale["currency"])
+        return sale
+
+    def _canonicalise_product(self, sale: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Replace the product name with its catalogue name and attach the SKU in-place.
+
+        Records are left untouched when no catalogue is configured or the
+        product does not match any entry.
+
+        Args:
+            sale: Sale dict to mutate.
+
+        Returns:
+            The same dict, with product and sku set on a catalogue match.
+        """
+        if not self.catalogue:
+            return sale
+        entry = self.catalogue.resolve((sale.get("product") or "").strip())
+        if entry:
+            sale["product"] = entry.name
+            sale["sku"] = entry.sku
         return sale
 
     def _is_valid(self, sale: Dict[str, Any]) -> bool:
@@ -126,12 +202,14 @@ class ValidatorAgent:
         """
         return all(sale.get(f) for f in REQUIRED_FIELDS)
 
-    async def _fix_with_groq(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    async def _fix_with_llm(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
-        Send incomplete sale records to the Groq LLM for best-effort repair.
+        Send incomplete sale records to the LLM for best-effort repair.
 
         The LLM is prompted to infer missing numeric fields, standardise currency
-        codes, and keep descriptions concise without inventing data.
+        codes, and keep descriptions concise without inventing data. Records are
+        sent as compact id-prefixed rows and the LLM answers with only the
+        changed fields per id, which are merged back into the originals.
 
         Args:
             records: List of sale dicts that failed local validation.
@@ -139,19 +217,33 @@ class ValidatorAgent:
         Returns:
             List of repaired sale dicts that pass the validity check.
             Returns an empty list if the LLM response cannot be parsed.
+
+        Raises:
+            TokenBudgetExceeded: if the job's LLM token budget is spent.
         """
-        payload = json.dumps(records, ensure_ascii=False)
-        response = groq_client.chat.completions.create(
-            model=MODEL,
-            max_tokens=4096,
-            reasoning_effort="none",
-            messages=[
-                {"role": "system", "content": FIX_PROMPT},
-                {"role": "user", "content": payload},
-            ],
-        )
+        payload = compact_records(records, RECORD_COLUMNS)
+        with reserve_budget(FIX_PROMPT + payload, MAX_TOKENS) as reservation:
+            response = await io_pool.run(
+                complete,
+                "validator",
+                max_tokens=MAX_TOKENS,
+                messages=[
+                    {"role": "system", "content": FIX_PROMPT},
+                    {"role": "user", "content": payload},
+                ],
+                json_mode=True,
+            )
+            reservation.settle(response)
         try:
-            fixed = json.loads(response.choices[0].message.content)
-            return [s for s in fixed if self._is_valid(s)]
-        except json.JSONDecodeError:
+            fixes = json.loads(response.content).get("fixes", {})
+        except (json.JSONDecodeError, AttributeError):
+            record_parse_failure("validator")
             return []
+
+        fixed = []
+        for idx, record in enumerate(records):
+            changes = fixes.get(str(idx)) if isinstance(fixes, dict) else None
+            if isinstance(changes, dict):
+                record = {**record, **{k: v for k, v in changes.items() if k in RECORD_COLUMNS}}
+            fixed.append(self._coerce_numerics(record))
+        return [s for s in fixed if self._is_valid(s)]
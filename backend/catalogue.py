@@ -0,0 +1,225 @@
+"""
+Optional product catalogue used to map extracted product strings to canonical SKUs.
+
+The catalogue is loaded from a CSV or JSON file (path in PRODUCT_CATALOGUE) and
+indexed in memory by normalised token key plus a character trigram inverted
+index for fuzzy matching, so spellings such as "cx leite 1L" and
+"Leite 1 litro caixa" resolve to the same entry without an LLM call. Pack
+sizes ("1l", "5kg", "12un") must match exactly; only the remaining words are
+matched fuzzily, so "Arroz 1kg" never resolves to "Arroz 5kg".
+
+CSV files need `sku` and `name` columns and may carry an `aliases` column with
+"|"-separated alternative spellings. JSON files hold a list of objects with the
+same keys (`aliases` as a list).
+"""
+
+import csv
+import json
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from dedup import normalize_tokens
+
+# Minimum trigram Jaccard similarity for a fuzzy match to be accepted
+MATCH_THRESHOLD = 0.55
+
+# Number of distinct raw product strings whose resolution is memoised
+RESOLVE_CACHE_SIZE = 4096
+
+# Common unit/packaging spellings collapsed to one token before matching
+TOKEN_SYNONYMS = {
+    "litro": "l", "litros": "l", "lt": "l", "lts": "l", "liter": "l", "litre": "l",
+    "caixa": "cx", "caixas": "cx", "box": "cx", "boxes": "cx",
+    "quilo": "kg", "quilos": "kg", "kilo": "kg", "kilos": "kg",
+    "grama": "g", "gramas": "g", "gr": "g",
+    "unidade": "un", "unidades": "un", "unit": "un", "units": "un",
+    "pacote": "pct", "pacotes": "pct", "pack": "pct",
+}
+
+UNIT_TOKENS = {"l", "ml", "kg", "g", "un", "cx", "pct"}
+
+# A merged number+unit token from product_key, e.g. "1l", "500g", "12un"
+SIZE_TOKEN_RE = re.compile(rf"^\d+(?:{'|'.join(sorted(UNIT_TOKENS))})$")
+
+
+@dataclass
+class CatalogueEntry:
+    """
+    A single canonical product.
+
+    Attributes:
+        sku:     Stock-keeping unit identifier.
+        name:    Canonical display name written back into sale records.
+        aliases: Alternative spellings that should resolve to this entry.
+    """
+    sku: str
+    name: str
+    aliases: List[str] = field(default_factory=list)
+
+
+def product_key(text: str) -> str:
+    """
+    Return an order-insensitive normalised key for a product string.
+
+    Accents and punctuation are stripped, unit synonyms are collapsed, and a
+    number followed by a unit is joined ("1 litro" → "1l").
+    """
+    tokens = [TOKEN_SYNONYMS.get(t, t) for t in normalize_tokens(text)]
+    merged: List[str] = []
+    for token in tokens:
+        if token in UNIT_TOKENS and merged and merged[-1].isdigit():
+            merged[-1] += token
+        else:
+            merged.append(token)
+    return " ".join(sorted(merged))
+
+
+def split_sizes(key: str) -> Tuple[FrozenSet[str], str]:
+    """
+    Separate the pack-size tokens of a product key from its other words.
+
+    Returns:
+        Tuple of (size tokens, remaining key), e.g. "1kg arroz" → ({"1kg"}, "arroz").
+    """
+    tokens = key.split()
+    sizes = frozenset(t for t in tokens if SIZE_TOKEN_RE.match(t))
+    return sizes, " ".join(t for t in tokens if t not in sizes)
+
+
+def _trigrams(key: str) -> Set[str]:
+    """Return the character trigrams of a product key, padded at word edges."""
+    grams: Set[str] = set()
+    for token in key.split():
+        padded = f" {token} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class ProductCatalogue:
+    """In-memory lookup index over catalogue entries."""
+
+    def __init__(self, entries: List[CatalogueEntry], threshold: float = MATCH_THRESHOLD):
+        """
+        Build the exact-key and trigram indexes for the given entries.
+
+        Args:
+            entries:   Canonical products to index.
+            threshold: Minimum trigram similarity for a fuzzy match.
+        """
+        self.entries = entries
+        self.threshold = threshold
+        self._exact: Dict[str, int] = {}
+        self._sizes: List[FrozenSet[str]] = []
+        self._grams: List[Set[str]] = []
+        self._owner: List[int] = []
+        self._inverted: Dict[str, List[int]] = {}
+
+        for entry_idx, entry in enumerate(entries):
+            for spelling in [entry.name, *entry.aliases]:
+                key = product_key(spelling)
+                if not key:
+                    continue
+                self._exact.setdefault(key, entry_idx)
+                sizes, words = split_sizes(key)
+                grams = _trigrams(words)
+                variant_idx = len(self._grams)
+                self._sizes.append(sizes)
+                self._grams.append(grams)
+                self._owner.append(entry_idx)
+                for gram in grams:
+                    self._inverted.setdefault(gram, []).append(variant_idx)
+
+        self._resolve_cached = lru_cache(maxsize=RESOLVE_CACHE_SIZE)(self._resolve)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def resolve(self, product: str) -> Optional[CatalogueEntry]:
+        """
+        Map a raw product string to its catalogue entry.
+
+        Results are memoised in an LRU cache keyed on the raw string.
+
+        Args:
+            product: Product text as extracted from the chat.
+
+        Returns:
+            The matching CatalogueEntry, or None if nothing is close enough.
+        """
+        if not product:
+            return None
+        return self._resolve_cached(product)
+
+    def _resolve(self, product: str) -> Optional[CatalogueEntry]:
+        """
+        Uncached lookup: exact normalised key first, then trigram similarity of
+        the non-size words among variants with exactly the same pack sizes.
+        """
+        key = product_key(product)
+        if not key:
+            return None
+        if key in self._exact:
+            return self.entries[self._exact[key]]
+
+        sizes, words = split_sizes(key)
+        grams = _trigrams(words)
+        overlap: Counter = Counter()
+        for gram in grams:
+            for variant_idx in self._inverted.get(gram, ()):
+                if self._sizes[variant_idx] == sizes:
+                    overlap[variant_idx] += 1
+
+        best_idx, best_score = None, 0.0
+        for variant_idx, shared in overlap.items():
+            union = len(grams) + len(self._grams[variant_idx]) - shared
+            score = shared / union
+            if score > best_score:
+                best_idx, best_score = variant_idx, score
+
+        if best_idx is None or best_score < self.threshold:
+            return None
+        return self.entries[self._owner[best_idx]]
+
+
+def load_catalogue(path: str) -> ProductCatalogue:
+    """
+    Load a product catalogue from a .csv or .json file.
+
+    Args:
+        path: Filesystem path to the catalogue.
+
+    Returns:
+        A populated ProductCatalogue.
+
+    Raises:
+        ValueError: if the file extension is not .csv or .json.
+    """
+    entries: List[CatalogueEntry] = []
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                aliases = [a.strip() for a in (row.get("aliases") or "").split("|") if a.strip()]
+                entries.append(CatalogueEntry(sku=row["sku"].strip(), name=row["name"].strip(), aliases=aliases))
+    elif path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            for item in json.load(f):
+                entries.append(
+                    CatalogueEntry(sku=str(item["sku"]), name=item["name"], aliases=list(item.get("aliases", [])))
+                )
+    else:
+        raise ValueError(f"Unsupported catalogue format: {path}")
+    return ProductCatalogue(entries)
+
+
+def load_default_catalogue() -> Optional[ProductCatalogue]:
+    """Load the catalogue named by the PRODUCT_CATALOGUE env var, or None if unset."""
+    path = os.getenv("PRODUCT_CATALOGUE")
+    if not path:
+        return None
+    return load_catalogue(path)
+
@@ -0,0 +1,301 @@
+"""
+Local near-duplicate detection for sale records.
+
+Sales reps often forward or re-post the same offer with small wording changes,
+which slips past exact (timestamp, sender, product) deduplication. This module
+clusters such repeats with MinHash signatures and locality-sensitive hashing
+(LSH) so suspected reposts can be flagged before any LLM call is made.
+
+A fixed list price is normal in these chats, so a matching price alone says
+little: records are only compared within the same (sender, quantity, price)
+bucket and only when they were posted within REPOST_WINDOW of each other.
+Each record is hashed once, so clustering runs in near-linear time.
+"""
+
+import hashlib
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Signature length = BANDS × ROWS. With 8 bands of 4 rows, pairs with a
+# Jaccard similarity of ~0.6 or more have a high chance of sharing a bucket.
+NUM_BANDS = 8
+ROWS_PER_BAND = 4
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+
+# Minimum estimated Jaccard similarity for two records to count as duplicates
+SIMILARITY_THRESHOLD = 0.7
+
+# Character shingle size used inside each normalised token
+SHINGLE_SIZE = 3
+
+# Maximum time between two posts for the later one to count as a repost
+REPOST_WINDOW = timedelta(hours=6)
+
+# Date/time layouts of WhatsApp export timestamps, e.g. "31/12/2024, 15:45"
+_TIME_FORMATS = ("%H:%M", "%I:%M %p", "%I:%M%p")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _make_permutations(count: int) -> List[Tuple[int, int]]:
+    """
+    Build deterministic (a, b) coefficients for the universal hash family.
+
+    Derived from a fixed digest rather than `random` so signatures are stable
+    across processes and restarts.
+    """
+    perms = []
+    for i in range(count):
+        digest = hashlib.blake2b(f"minhash-{i}".encode(), digest_size=16).digest()
+        a = int.from_bytes(digest[:8], "little") % _MERSENNE_PRIME or 1
+        b = int.from_bytes(digest[8:], "little") % _MERSENNE_PRIME
+        perms.append((a, b))
+    return perms
+
+
+_PERMUTATIONS = _make_permutations(NUM_PERM)
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """
+    Lowercase, strip accents and split text into alphanumeric tokens.
+
+    Args:
+        text: Free-form product name or message text.
+
+    Returns:
+        List of normalised tokens, e.g. "Café 1L!" → ["cafe", "1l"].
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    ascii_text = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return TOKEN_RE.findall(ascii_text)
+
+
+def shingles(text: str) -> Set[str]:
+    """
+    Return the set of character shingles for the normalised tokens of text.
+
+    Shingling each token separately makes the set insensitive to word order
+    ("cx leite 1L" vs "leite 1L cx") while tolerating small typos.
+    """
+    result: Set[str] = set()
+    for token in normalize_tokens(text):
+        if len(token) <= SHINGLE_SIZE:
+            result.add(token)
+            continue
+        for i in range(len(token) - SHINGLE_SIZE + 1):
+            result.add(token[i:i + SHINGLE_SIZE])
+    return result
+
+
+def minhash_signature(shingle_set: Set[str]) -> Tuple[int, ...]:
+    """
+    Compute a MinHash signature of length NUM_PERM for a shingle set.
+
+    Args:
+        shingle_set: Non-empty set of shingles.
+
+    Returns:
+        Tuple of NUM_PERM minimum hash values.
+    """
+    base_hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little")
+        for s in shingle_set
+    ]
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in base_hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def estimate_similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """Return the fraction of matching MinHash slots — an estimate of Jaccard similarity."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+def price_bucket(sale: Dict[str, Any]) -> Optional[float]:
+    """
+    Return the price used to bucket a sale, or None when it has no price.
+
+    Unit price is preferred; total price is the fallback.
+    """
+    for field in ("unit_price", "total_price"):
+        val = sale.get(field)
+        if isinstance(val, (int, float)) and val:
+            return round(float(val), 2)
+    return None
+
+
+def bucket_key(sale: Dict[str, Any]) -> Tuple[str, Optional[float], Optional[float]]:
+    """
+    Return the (sender, quantity, price) bucket of a sale.
+
+    Only records in the same bucket are compared, so the same product sold by
+    another rep, in another quantity or at a new price is never a repost.
+    """
+    qty = sale.get("quantity")
+    quantity = round(float(qty), 3) if isinstance(qty, (int, float)) else None
+    sender = " ".join(str(sale.get("sender") or "").lower().split())
+    return sender, quantity, price_bucket(sale)
+
+
+def detect_day_first(timestamps: List[str]) -> bool:
+    """
+    Guess whether a chat's dates are day-first ("31/12/24") or month-first.
+
+    Returns:
+        False only when some date can only be read month-first.
+    """
+    for ts in timestamps:
+        parts = str(ts or "").split(",", 1)[0].split("/")
+        if len(parts) == 3 and parts[1].isdigit() and int(parts[1]) > 12:
+            return False
+    return True
+
+
+def parse_timestamp(timestamp: Optional[str], day_first: bool = True) -> Optional[datetime]:
+    """
+    Parse a WhatsApp export timestamp such as "31/12/2024, 15:45".
+
+    Args:
+        timestamp: Timestamp string from the parsed message.
+        day_first: Read "01/02" as 1 February rather than 2 January.
+
+    Returns:
+        datetime, or None if the timestamp is missing or unrecognised.
+    """
+    date_part, _, time_part = str(timestamp or "").partition(",")
+    parts = date_part.strip().split("/")
+    if len(parts) != 3 or not all(p.isdigit() for p in parts):
+        return None
+    day, month, year = (int(p) for p in parts) if day_first else (int(parts[1]), int(parts[0]), int(parts[2]))
+    if year < 100:
+        year += 2000
+    time_text = " ".join(time_part.upper().split())
+    for fmt in _TIME_FORMATS:
+        try:
+            clock = datetime.strptime(time_text, fmt)
+            return datetime(year, month, day, clock.hour, clock.minute)
+        except ValueError:
+            continue
+    return None
+
+
+def _record_text(sale: Dict[str, Any]) -> str:
+    """Concatenate the free-text fields of a sale used for similarity."""
+    return " ".join(
+        str(sale.get(f) or "") for f in ("product", "text", "notes")
+    )
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index that clusters near-duplicate sale records.
+
+    Records are added in chronological order; the first record of each cluster
+    is treated as the canonical one and every later member is reported as its
+    duplicate.
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD, window: timedelta = REPOST_WINDOW):
+        """
+        Args:
+            threshold: Minimum estimated Jaccard similarity to merge two records.
+            window:    Maximum time between two records in the same cluster.
+        """
+        self.threshold = threshold
+        self.window = window
+        self._buckets: Dict[Tuple[Any, int, Tuple[int, ...]], List[int]] = {}
+        self._signatures: List[Optional[Tuple[int, ...]]] = []
+        self._times: List[Optional[datetime]] = []
+        self._parent: List[int] = []
+
+    def _find(self, i: int) -> int:
+        """Return the cluster root of record i, compressing the path."""
+        while self._parent[i] != i:
+            self._parent[i] = self._parent[self._parent[i]]
+            i = self._parent[i]
+        return i
+
+    def _within_window(self, when: Optional[datetime], other: int) -> bool:
+        """Return True if record other was posted within the window of when."""
+        other_when = self._times[other]
+        if when is None or other_when is None:
+            return False
+        return abs(when - other_when) <= self.window
+
+    def add(self, sale: Dict[str, Any], when: Optional[datetime] = None) -> Optional[int]:
+        """
+        Index a sale and return the position of its canonical duplicate, if any.
+
+        Args:
+            sale: Sale dict with sender, product/notes text, quantity and price fields.
+            when: Time the sale was posted; records without one never match.
+
+        Returns:
+            Index (in insertion order) of the earliest record this sale
+            duplicates, or None if it is the first of its kind.
+        """
+        idx = len(self._signatures)
+        self._parent.append(idx)
+        self._times.append(when)
+
+        shingle_set = shingles(_record_text(sale))
+        if not shingle_set:
+            self._signatures.append(None)
+            return None
+
+        signature = minhash_signature(shingle_set)
+        self._signatures.append(signature)
+        bucket = bucket_key(sale)
+
+        match: Optional[int] = None
+        for band in range(NUM_BANDS):
+            start = band * ROWS_PER_BAND
+            key = (bucket, band, signature[start:start + ROWS_PER_BAND])
+            members = self._buckets.setdefault(key, [])
+            if match is None:
+                for other in members:
+                    if not self._within_window(when, other):
+                        continue
+                    other_sig = self._signatures[other]
+                    if estimate_similarity(signature, other_sig) >= self.threshold:
+                        match = self._find(other)
+                        break
+            members.append(idx)
+
+        if match is not None:
+            self._parent[idx] = match
+        return match
+
+
+def find_near_duplicates(
+    sales: List[Dict[str, Any]],
+    threshold: float = SIMILARITY_THRESHOLD,
+    window: timedelta = REPOST_WINDOW,
+) -> Dict[int, int]:
+    """
+    Cluster near-duplicate sales and map each repeat to its canonical record.
+
+    Args:
+        sales:     Sale dicts in chronological order.
+        threshold: Minimum estimated Jaccard similarity to merge two records.
+        window:    Maximum time between a record and its repost.
+
+    Returns:
+        Dict mapping the index of every duplicate record to the index of the
+        earliest record in its cluster. Canonical records are not included.
+    """
+    day_first = detect_day_first([s.get("timestamp") for s in sales])
+    index = NearDuplicateIndex(threshold, window)
+    duplicates: Dict[int, int] = {}
+    for i, sale in enumerate(sales):
+        canonical = index.add(sale, parse_timestamp(sale.get("timestamp"), day_first))
+        if canonical is not None:
+            duplicates[i] = canonical
+    return duplicates
@@ -0,0 +1,209 @@
+"""
+Bounded executor pools that keep blocking work off the event loop.
+
+Two pools are shared by the API and the agents:
+  cpu_pool — CPU-bound work: chat parsing, regex pre-filtering, Excel export
+  io_pool  — blocking I/O: synchronous LLM HTTP calls
+
+Each pool caps concurrency at its worker count and rejects work with
+PoolSaturated (HTTP 503) once more than max_queue calls are waiting, so a
+burst of large uploads degrades into fast rejections instead of an unbounded
+backlog. Queue depth and throughput counters are exposed through metrics()
+and reported by /health together with the event-loop lag measured by
+LoopLagMonitor.
+
+Configuration (environment variables):
+  CPU_POOL_WORKERS / CPU_POOL_QUEUE — default: CPU count / 32
+  CPU_POOL_KIND                     — "thread" (default) or "process"
+  IO_POOL_WORKERS / IO_POOL_QUEUE   — default: 16 / 256
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+import profiling
+
+load_dotenv()
+
+# Seconds between event-loop lag probes
+LAG_PROBE_INTERVAL = 0.5
+
+
+class PoolSaturated(Exception):
+    """Raised when a pool's wait queue is full. Maps to HTTP 503."""
+    status_code = 503
+
+
+class ExecutorPool:
+    """An executor with a concurrency limit, a bounded wait queue and metrics."""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, kind: str = "thread"):
+        """
+        Args:
+            name:        Pool name used in metrics, e.g. "cpu".
+            max_workers: Calls allowed to run at once.
+            max_queue:   Calls allowed to wait for a worker before rejecting.
+            kind:        "thread" or "process".
+        """
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Pool kind must be 'thread' or 'process', got {kind!r}")
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.active = 0
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_queued_seen = 0
+        self.busy_seconds = 0.0
+
+    def _ensure_started(self) -> None:
+        """Create the executor and semaphore lazily, inside the running loop."""
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=f"{self.name}-pool"
+                )
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run func(*args, **kwargs) on the pool and await its result.
+
+        Thread pools run the call in a copy of the current context, so context
+        variables such as the job's token budget stay visible. Inside a
+        profiled coroutine the call runs under its own profiler in the worker
+        and its stats are handed to the coroutine's report.
+
+        Raises:
+            PoolSaturated: if max_queue calls are already waiting for a worker.
+        """
+        self._ensure_started()
+        if self.queued >= self.max_queue and self.active >= self.max_workers:
+            self.rejected += 1
+            raise PoolSaturated(f"The {self.name} pool is saturated; try again shortly.")
+
+        call = functools.partial(func, *args, **kwargs)
+        if self.kind == "thread":
+            call = functools.partial(contextvars.copy_context().run, call)
+        collector = profiling.pool_profiles()
+        if collector is not None:
+            # Process workers always profile themselves; thread workers only
+            # when the request's profiler does not already cover them
+            profile = collector.profile_threads or self.kind == "process"
+            call = functools.partial(profiling.run_profiled, call, profile)
+
+        self.queued += 1
+        self.max_queued_seen = max(self.max_queued_seen, self.queued)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.active += 1
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, call)
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.busy_seconds += time.perf_counter() - started
+            self.active -= 1
+            self._semaphore.release()
+        self.completed += 1
+        return collector.unpack(result) if collector is not None else result
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return concurrency, queue-depth and throughput counters."""
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.queued,
+            "max_queued_seen": self.max_queued_seen,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
+
+    def shutdown(self) -> None:
+        """Stop the executor; queued calls are allowed to finish."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._semaphore = None
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a fixed-interval sleep."""
+
+    def __init__(self, interval: float = LAG_PROBE_INTERVAL):
+        """
+        Args:
+            interval: Seconds between probes.
+        """
+        self.interval = interval
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _probe(self) -> None:
+        """Sleep in a loop and record the overshoot of each wake-up."""
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(time.perf_counter() - expected, 0.0) * 1000
+            self.last_ms = round(lag_ms, 2)
+            self.max_ms = max(self.max_ms, self.last_ms)
+
+    def start(self) -> None:
+        """Start probing on the running loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._probe())
+
+    def stop(self) -> None:
+        """Cancel the probe task."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def metrics(self) -> Dict[str, float]:
+        """Return the latest and worst observed loop lag in milliseconds."""
+        return {"last_ms": self.last_ms, "max_ms": self.max_ms}
+
+
+cpu_pool = ExecutorPool(
+    "cpu",
+    max_workers=int(os.getenv("CPU_POOL_WORKERS", str(os.cpu_count() or 2))),
+    max_queue=int(os.getenv("CPU_POOL_QUEUE", "32")),
+    kind=os.getenv("CPU_POOL_KIND", "thread").strip().lower(),
+)
+
+io_pool = ExecutorPool(
+    "io",
+    max_workers=int(os.getenv("IO_POOL_WORKERS", "16")),
+    max_queue=int(os.getenv("IO_POOL_QUEUE", "256")),
+)
+
+loop_lag = LoopLagMonitor()
+
+
+def pool_metrics() -> Dict[str, Dict[str, Any]]:
+    """Return metrics for every shared pool, keyed by pool name."""
+    return {pool.name: pool.metrics() for pool in (cpu_pool, io_pool)}
@@ -1,32 +1,39 @@
 """
 Rule-based sales extractor.
 Used as a fast pre-pass before the AI agents process the messages.
-The Groq client is initialised here and shared by agent modules.
+LLM clients live in llm.py.
 """
 
-import os
 import re
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
-from dotenv import load_dotenv
-from groq import Groq
+from numeric import AMOUNT_RE, STANDALONE_CURRENCY_PATTERN, normalize_currency, parse_number
 from parser import Message
 
-load_dotenv()
+# Amounts with optional currency symbol/code and multiplier, in any digit
+# script, e.g. "R$ 1.234,56", "AED 2.5k", "١٢٫٥ ر.س"
+CURRENCY_RE = AMOUNT_RE
 
-# Shared Groq client — imported by agent modules
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-MODEL = "qwen/qwen3-32b"
+# A currency symbol or code standing on its own (not inside a word). Word-like
+# aliases such as "SR" or "REAL" are left out; they only count next to an amount.
+CURRENCY_TOKEN_RE = re.compile(
+    rf"(?<![^\W\d_])(?:{STANDALONE_CURRENCY_PATTERN})(?![^\W\d_])", re.IGNORECASE
+)
 
-# Common currency symbols and codes
-CURRENCY_RE = re.compile(
-    r"(?:R\$|USD|BRL|EUR|GBP|\$|€|£)?\s*\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?",
+# Matches standalone quantity expressions with common unit abbreviations in
+# English, Portuguese and Arabic, e.g. "10 pcs", "3 units", "2 caixas", "1,5 kg", "٣ حبات"
+QUANTITY_RE = re.compile(
+    r"(?<![\w.,])(\d+(?:[.,]\d+)?)\s*"
+    r"(?:un|und|unid|unidades?|pcs?|pieces?|units?|caixas?|cx|boxes?|kgs?|quilos?|g|gr|"
+    r"l|lts?|litros?|liters?|litres?|ml|pct|pacotes?|packs?|dz|d[uú]zias?|dozens?|"
+    r"fardos?|sacos?|bags?|garrafas?|bottles?|latas?|cans?|"
+    r"حبة|حبات|كرتونة|كراتين|علبة|علب|كيلو)(?![^\W\d_])",
     re.IGNORECASE,
 )
 
-# Matches standalone quantity expressions with common unit abbreviations
-# e.g. "10 pcs", "3 units", "2 caixas"
-QUANTITY_RE = re.compile(r"\b(\d+)\s*(?:un|pcs?|pieces?|units?|caixas?|boxes?)\b", re.IGNORECASE)
+# A bare amount written with cents ("5,00", "12.50") — the only unmarked number
+# the local fallback accepts as a price
+CENTS_RE = re.compile(r"\d[.,٫]\d{2}$")
 
 # Keywords that commonly precede product identifiers in sales messages
 PRODUCT_KEYWORDS = [
@@ -46,7 +53,7 @@ def extract_sales_candidates(messages: List[Message]) -> List[Dict[str, Any]]:
             continue
 
         text = msg.text
-        prices = CURRENCY_RE.findall(text)
+        prices = [m.group(0).strip() for m in CURRENCY_RE.finditer(text)]
         quantities = QUANTITY_RE.findall(text)
 
         if prices or quantities:
@@ -63,15 +70,93 @@ def extract_sales_candidates(messages: List[Message]) -> List[Dict[str, Any]]:
     return candidates
 
 
-def normalize_price(raw: str) -> float:
-    """Strip non-numeric chars and return a float."""
-    cleaned = re.sub(r"[^\d,.]", "", raw)
-    # Handle Brazilian format: 1.234,56 → 1234.56
-    if re.search(r"\d{1,3}\.\d{3},\d{2}$", cleaned):
-        cleaned = cleaned.replace(".", "").replace(",", ".")
-    else:
-        cleaned = cleaned.replace(",", "")
-    try:
-        return float(cleaned)
-    except ValueError:
-        return 0.0
+def normalize_price(raw: str, decimal_sep: Optional[str] = None) -> float:
+    """
+    Parse a price string in any supported locale and return a float.
+
+    Args:
+        raw:         Price text, e.g. "R$ 1.234,56", "$1,234.56" or "2,5 mil".
+        decimal_sep: The chat's decimal separator, for ambiguous values.
+
+    Returns:
+        The parsed value, or 0.0 if no number is found.
+    """
+    value = parse_number(raw, decimal_sep)
+    return value if value is not None else 0.0
+
+
+def detect_currency(text: str) -> str:
+    """
+    Return the ISO code of the currency in text, or "".
+
+    A currency written next to an amount ("SR 99", "10 reais") wins; otherwise
+    the first standalone symbol or unambiguous code is used.
+    """
+    for match in CURRENCY_RE.finditer(text):
+        marker = match.group("pre") or match.group("post")
+        if marker:
+            return normalize_currency(marker) or ""
+    match = CURRENCY_TOKEN_RE.search(text)
+    if not match:
+        return ""
+    return normalize_currency(match.group(0)) or ""
+
+
+def price_hints(candidate: Dict[str, Any]) -> List[str]:
+    """
+    Return the price hints of a candidate that can safely be read as prices.
+
+    Amounts carrying a currency marker are used when present. Otherwise only
+    bare amounts written with cents ("5,00") count, and never the number of a
+    quantity expression; plain integers are too often quantities, times or
+    ranges ("2 cx", "10-12h") to be taken as prices.
+    """
+    marked = [raw for raw in candidate["hint_prices"] if detect_currency(raw)]
+    if marked:
+        return marked
+    quantities = set(candidate["hint_quantities"])
+    return [
+        raw for raw in candidate["hint_prices"]
+        if CENTS_RE.search(raw) and raw not in quantities
+    ]
+
+
+def candidates_to_sales(
+    candidates: List[Dict[str, Any]], decimal_sep: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Build sale records from regex candidates without calling the LLM.
+
+    Used as a degraded, local-only extraction path when a job exceeds its
+    candidate or token limits. The first line of the message becomes the
+    product, the first quantity hint the quantity and the first price hint
+    (see price_hints) the unit price; the total is derived when both are
+    present. Without a usable price hint the prices are left empty rather
+    than guessed.
+
+    Args:
+        candidates:  Candidate dicts from extract_sales_candidates.
+        decimal_sep: The chat's decimal separator, for ambiguous values.
+
+    Returns:
+        List of sale dicts in the same shape the ExtractorAgent produces.
+    """
+    sales = []
+    for c in candidates:
+        quantity = parse_number(c["hint_quantities"][0], decimal_sep) if c["hint_quantities"] else None
+        prices = [p for p in (normalize_price(raw, decimal_sep) for raw in price_hints(c)) if p]
+        unit_price = prices[0] if prices else None
+        total_price = round(quantity * unit_price, 2) if quantity and unit_price else None
+        sales.append(
+            {
+                "timestamp": c["timestamp"],
+                "sender": c["sender"],
+                "product": c["text"].splitlines()[0].strip()[:120],
+                "quantity": quantity,
+                "unit_price": unit_price,
+                "total_price": total_price,
+                "currency": detect_currency(c["text"]) or None,
+                "notes": "Extracted locally (LLM limit reached).",
+            }
+        )
+    return sales
@@ -0,0 +1,231 @@
+"""
+Per-job resource limits and LLM token accounting.
+
+Limits are read from environment variables once at import time:
+
+  MAX_UPLOAD_BYTES  — maximum size of an uploaded export (enforced while streaming)
+  MAX_MESSAGES      — maximum number of parsed messages per job
+  MAX_CANDIDATES    — maximum number of regex sale candidates per job
+  MAX_LLM_TOKENS    — maximum LLM tokens (prompt + completion) spent per job
+  LIMIT_MODE        — what to do when a message/candidate/token limit is hit:
+                        reject   → fail the request (413 / 429)
+                        truncate → keep only the most recent messages/candidates;
+                                   a spent token budget still fails with 429
+                        local    → as truncate, but an exceeded candidate or token
+                                   limit falls back to local rule-based extraction
+
+The active JobBudget is held in a context variable so agents can charge tokens
+without threading it through every call; the thread pools in executors.py
+propagate it to worker threads. Each LLM call reserves its prompt plus its
+completion cap (max_tokens) before it is sent and settles to the actual usage
+afterwards, so concurrent calls cannot jointly overshoot MAX_LLM_TOKENS.
+"""
+
+import contextvars
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LIMIT_MODES = ("reject", "truncate", "local")
+
+# Rough characters-per-token ratio used when the provider reports no usage
+CHARS_PER_TOKEN = 4
+
+
+class LimitExceeded(Exception):
+    """Raised when a job exceeds a size limit. Maps to HTTP 413."""
+    status_code = 413
+
+
+class TokenBudgetExceeded(LimitExceeded):
+    """Raised when a job has spent its LLM token budget. Maps to HTTP 429."""
+    status_code = 429
+
+
+@dataclass(frozen=True)
+class JobLimits:
+    """
+    Resource limits applied to a single upload.
+
+    Attributes:
+        max_bytes:      Maximum upload size in bytes.
+        max_messages:   Maximum parsed messages processed.
+        max_candidates: Maximum sale candidates sent to the LLM stages.
+        max_llm_tokens: Maximum LLM tokens spent on the job.
+        mode:           Degradation mode — one of LIMIT_MODES.
+    """
+    max_bytes: int = 10 * 1024 * 1024
+    max_messages: int = 50_000
+    max_candidates: int = 2_000
+    max_llm_tokens: int = 200_000
+    mode: str = "truncate"
+
+    @classmethod
+    def from_env(cls) -> "JobLimits":
+        """Build limits from environment variables, falling back to the defaults."""
+        mode = os.getenv("LIMIT_MODE", cls.mode).strip().lower()
+        if mode not in LIMIT_MODES:
+            raise ValueError(f"LIMIT_MODE must be one of {LIMIT_MODES}, got {mode!r}")
+        return cls(
+            max_bytes=int(os.getenv("MAX_UPLOAD_BYTES", cls.max_bytes)),
+            max_messages=int(os.getenv("MAX_MESSAGES", cls.max_messages)),
+            max_candidates=int(os.getenv("MAX_CANDIDATES", cls.max_candidates)),
+            max_llm_tokens=int(os.getenv("MAX_LLM_TOKENS", cls.max_llm_tokens)),
+            mode=mode,
+        )
+
+
+DEFAULT_LIMITS = JobLimits.from_env()
+
+
+def estimate_tokens(text: str) -> int:
+    """Return a rough token count for text (≈4 characters per token)."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class JobBudget:
+    """Thread-safe LLM token counter for one job."""
+
+    def __init__(self, max_tokens: int):
+        """
+        Args:
+            max_tokens: Tokens the job may spend before further calls are refused.
+        """
+        self.max_tokens = max_tokens
+        self.used = 0
+        self.reserved = 0
+        self.per_agent: Dict[str, Dict[str, float]] = {}
+        self.parse_failures: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def check(self, prompt: str, max_tokens: int = 0) -> int:
+        """
+        Reserve the worst-case cost of a call, or refuse it.
+
+        Args:
+            prompt:     Full prompt text about to be sent.
+            max_tokens: Completion token cap of the call.
+
+        Returns:
+            Number of tokens reserved; pass it to record() or release().
+
+        Raises:
+            TokenBudgetExceeded: if spent plus reserved tokens cannot cover the call.
+        """
+        cost = estimate_tokens(prompt) + max_tokens
+        with self._lock:
+            if self.used + self.reserved + cost > self.max_tokens:
+                raise TokenBudgetExceeded(
+                    f"LLM token budget of {self.max_tokens} exhausted "
+                    f"({self.used} used, {self.reserved} reserved by calls in flight)."
+                )
+            self.reserved += cost
+        return cost
+
+    def release(self, reserved: int) -> None:
+        """Return a reservation made by check() for a call that did not complete."""
+        with self._lock:
+            self.reserved -= reserved
+
+    def record(self, completion: Any, prompt: str = "", reserved: int = 0) -> int:
+        """
+        Add the tokens used by a completed call to the running total.
+
+        Uses the provider-reported usage when present, otherwise an estimate
+        from the prompt and completion text. The call's reservation is
+        released at the same time. Calls, total tokens, completion tokens and
+        wall time are also tallied per agent.
+
+        Args:
+            completion: llm.Completion returned by the provider.
+            prompt:     Prompt text, used only for the fallback estimate.
+            reserved:   Tokens reserved for the call by check().
+
+        Returns:
+            Number of tokens charged.
+        """
+        tokens = completion.total_tokens
+        if tokens is None:
+            tokens = estimate_tokens(prompt) + estimate_tokens(completion.content)
+        completion_tokens = completion.completion_tokens
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens(completion.content)
+        with self._lock:
+            self.reserved -= reserved
+            self.used += tokens
+            stats = self.per_agent.setdefault(
+                completion.agent or "unknown", {"calls": 0, "tokens": 0, "completion_tokens": 0, "seconds": 0.0}
+            )
+            stats["calls"] += 1
+            stats["tokens"] += tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["seconds"] = round(stats["seconds"] + completion.elapsed, 3)
+        return tokens
+
+    def record_parse_failure(self, agent: str) -> None:
+        """Count an LLM response that could not be parsed, so the job is known to be partial."""
+        with self._lock:
+            self.parse_failures[agent] = self.parse_failures.get(agent, 0) + 1
+
+
+current_budget: contextvars.ContextVar[Optional[JobBudget]] = contextvars.ContextVar(
+    "current_budget", default=None
+)
+
+
+class BudgetReservation:
+    """
+    Tokens held on the active job's budget for one LLM call.
+
+    Use as a context manager around the call and settle() it with the
+    completion; a reservation left unsettled (the call failed or was
+    cancelled) is released on exit. Outside a job it does nothing.
+
+        with reserve_budget(prompt, max_tokens) as reservation:
+            response = complete(...)
+            reservation.settle(response)
+    """
+
+    def __init__(self, budget: Optional[JobBudget], prompt: str, tokens: int):
+        self.budget = budget
+        self.prompt = prompt
+        self.tokens = tokens
+
+    def settle(self, completion: Any) -> None:
+        """Charge the completed call and release the rest of the reservation."""
+        if self.budget is not None:
+            self.budget.record(completion, self.prompt, self.tokens)
+            self.tokens = 0
+
+    def __enter__(self) -> "BudgetReservation":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self.budget is not None and self.tokens:
+            self.budget.release(self.tokens)
+            self.tokens = 0
+
+
+def reserve_budget(prompt: str, max_tokens: int) -> BudgetReservation:
+    """
+    Reserve prompt + max_tokens on the active job's budget before an LLM call.
+
+    Raises:
+        TokenBudgetExceeded: if the job's budget cannot cover the call.
+    """
+    budget = current_budget.get()
+    if budget is None:
+        return BudgetReservation(None, prompt, 0)
+    return BudgetReservation(budget, prompt, budget.check(prompt, max_tokens))
+
+
+def record_parse_failure(agent: str) -> None:
+    """Mark the active job's result as partial after an unparseable LLM response."""
+    budget = current_budget.get()
+    if budget is not None:
+        budget.record_parse_failure(agent)
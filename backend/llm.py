@@ -0,0 +1,355 @@
+"""
+Pluggable LLM provider backends with per-agent routing and failover.
+
+Providers:
+  groq   — Groq cloud API (GROQ_API_KEY, GROQ_MODEL)
+  local  — any OpenAI-compatible /chat/completions server such as llama.cpp or
+           vLLM (LOCAL_LLM_BASE_URL, LOCAL_LLM_MODEL, LOCAL_LLM_API_KEY)
+  mock   — canned offline responses for tests and demos
+
+Each agent asks the router for a completion by name ("classifier", "extractor",
+"validator", "auditor"). The route for an agent comes from LLM_ROUTE_<AGENT>
+(falling back to LLM_ROUTE_DEFAULT, then "groq") and is a comma-separated list
+of providers tried in order, each optionally pinned to a model:
+
+  LLM_ROUTE_EXTRACTOR=local:qwen2.5-14b-instruct,groq
+  LLM_ROUTE_AUDITOR=groq
+
+A provider that times out, is rate-limited or errors is put on cooldown for
+LLM_COOLDOWN_SECONDS and the next provider in the route is tried.
+
+Agents ask for compact JSON responses (ids and positional rows rather than
+echoed records). With json_mode=True, providers that support it are asked for
+schema-constrained JSON-object output.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GROQ_MODEL = "qwen/qwen3-32b"
+
+# Groq models that accept reasoning_effort="none" to skip their thinking output;
+# other models reject the parameter, so it is only sent to these
+NO_REASONING_MODEL_PREFIXES = ("qwen/qwen3",)
+
+# Seconds before an LLM request is abandoned and the next provider is tried
+REQUEST_TIMEOUT = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+
+# Seconds a failing provider is skipped before it is tried again
+COOLDOWN_SECONDS = float(os.getenv("LLM_COOLDOWN_SECONDS", "30"))
+
+# Pooled HTTP connections kept open per provider
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "10"))
+
+AGENTS = ("classifier", "extractor", "validator", "auditor")
+
+
+class ProviderError(Exception):
+    """Raised when every provider on an agent's route has failed. Maps to HTTP 502."""
+    status_code = 502
+
+
+@dataclass
+class Completion:
+    """
+    Provider-neutral chat completion result.
+
+    Attributes:
+        content:           Text of the first choice.
+        total_tokens:      Prompt + completion tokens reported by the provider, if any.
+        completion_tokens: Completion tokens reported by the provider, if any.
+        provider:          Name of the provider that answered.
+        model:             Model that produced the answer.
+        agent:             Agent the completion was routed for.
+        elapsed:           Wall time of the successful call in seconds.
+    """
+    content: str
+    total_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    provider: str = ""
+    model: str = ""
+    agent: str = ""
+    elapsed: float = 0.0
+
+
+class Provider(ABC):
+    """Base class for LLM backends."""
+
+    name = "base"
+
+    def __init__(self, model: str):
+        """
+        Args:
+            model: Default model used when a route does not pin one.
+        """
+        self.model = model
+
+    @abstractmethod
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        model: Optional[str] = None,
+        json_mode: bool = False,
+    ) -> Completion:
+        """
+        Run a chat completion.
+
+        Args:
+            messages:   OpenAI-style list of {"role", "content"} dicts.
+            max_tokens: Completion token cap.
+            model:      Model override; defaults to self.model.
+            json_mode:  Request JSON-object output where the backend supports it.
+
+        Returns:
+            Completion with the response text and token usage.
+        """
+
+
+class GroqProvider(Provider):
+    """Groq cloud API via the official SDK, with its own pooled HTTP client."""
+
+    name = "groq"
+
+    def __init__(self, api_key: Optional[str], model: str = DEFAULT_GROQ_MODEL):
+        super().__init__(model)
+        from groq import Groq
+
+        self.client = Groq(
+            api_key=api_key,
+            timeout=REQUEST_TIMEOUT,
+            max_retries=0,  # Failover is handled by the router
+            http_client=httpx.Client(limits=httpx.Limits(max_connections=MAX_CONNECTIONS)),
+        )
+
+    def complete(self, messages, max_tokens, model=None, json_mode=False):
+        model = model or self.model
+        extra: Dict[str, Any] = {"response_format": {"type": "json_object"}} if json_mode else {}
+        if model.startswith(NO_REASONING_MODEL_PREFIXES):
+            extra["reasoning_effort"] = "none"
+        response = self.client.chat.completions.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=messages,
+            **extra,
+        )
+        usage = getattr(response, "usage", None)
+        return Completion(
+            content=response.choices[0].message.content or "",
+            total_tokens=getattr(usage, "total_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None),
+            provider=self.name,
+            model=model,
+        )
+
+
+class OpenAICompatibleProvider(Provider):
+    """Any server exposing the OpenAI /chat/completions API (llama.cpp, vLLM, …)."""
+
+    name = "local"
+
+    def __init__(self, base_url: str, model: str, api_key: Optional[str] = None):
+        """
+        Args:
+            base_url: API root including the version prefix, e.g. http://localhost:8080/v1.
+            model:    Default model name served by the endpoint.
+            api_key:  Optional bearer token.
+        """
+        super().__init__(model)
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.client = httpx.Client(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS),
+        )
+
+    def complete(self, messages, max_tokens, model=None, json_mode=False):
+        model = model or self.model
+        payload = {"model": model, "messages": messages, "max_tokens": max_tokens}
+        if json_mode:
+            payload["response_format"] = {"type": "json_object"}
+        response = self.client.post("/chat/completions", json=payload)
+        response.raise_for_status()
+        body = response.json()
+        usage = body.get("usage") or {}
+        return Completion(
+            content=body["choices"][0]["message"].get("content") or "",
+            total_tokens=usage.get("total_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            provider=self.name,
+            model=model,
+        )
+
+
+class MockProvider(Provider):
+    """Offline provider returning canned responses; never touches the network."""
+
+    name = "mock"
+
+    def __init__(
+        self,
+        responder: Optional[Callable[[List[Dict[str, str]]], str]] = None,
+        model: str = "mock",
+    ):
+        """
+        Args:
+            responder: Callable mapping the request messages to response text.
+                       Defaults to always answering "{}".
+        """
+        super().__init__(model)
+        self.responder = responder or (lambda messages: "{}")
+        self.calls: List[List[Dict[str, str]]] = []
+
+    def complete(self, messages, max_tokens, model=None, json_mode=False):
+        self.calls.append(messages)
+        return Completion(content=self.responder(messages), provider=self.name, model=model or self.model)
+
+
+def parse_route(spec: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    Parse a route spec such as "local:llama3,groq" into (provider, model) pairs.
+
+    Args:
+        spec: Comma-separated provider names, each optionally suffixed with ":model".
+
+    Returns:
+        Ordered list of (provider_name, model_or_None) tuples.
+    """
+    route = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, model = part.partition(":")
+        route.append((name.strip(), model.strip() or None))
+    return route
+
+
+class LLMRouter:
+    """Routes each agent's completions to its providers, failing over on errors."""
+
+    def __init__(self, providers: Dict[str, Provider], routes: Dict[str, List[Tuple[str, Optional[str]]]]):
+        """
+        Args:
+            providers: Provider instances keyed by name.
+            routes:    Per-agent ordered (provider_name, model) lists. The
+                       "default" key is used for agents without a route.
+        """
+        self.providers = providers
+        self.routes = routes
+        self._cooldown_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def route_for(self, agent: str) -> List[Tuple[str, Optional[str]]]:
+        """Return the (provider, model) route configured for an agent."""
+        return self.routes.get(agent) or self.routes["default"]
+
+    def complete(
+        self, agent: str, messages: List[Dict[str, str]], max_tokens: int, json_mode: bool = False
+    ) -> Completion:
+        """
+        Run a completion for an agent, trying its route in order.
+
+        Providers on cooldown are skipped while a healthy alternative remains.
+
+        Args:
+            agent:      Agent name, e.g. "extractor".
+            messages:   OpenAI-style chat messages.
+            max_tokens: Completion token cap.
+            json_mode:  Request JSON-object output where the provider supports it.
+
+        Returns:
+            Completion from the first provider that succeeds.
+
+        Raises:
+            ProviderError: if every provider on the route fails.
+        """
+        route = [(n, m) for n, m in self.route_for(agent) if n in self.providers]
+        if not route:
+            raise ProviderError(f"No configured provider for agent {agent!r}.")
+
+        now = time.monotonic()
+        with self._lock:
+            healthy = [r for r in route if self._cooldown_until.get(r[0], 0) <= now]
+        attempts = healthy or route
+
+        last_exc: Optional[Exception] = None
+        for name, model in attempts:
+            provider = self.providers[name]
+            started = time.monotonic()
+            try:
+                completion = provider.complete(messages, max_tokens, model=model, json_mode=json_mode)
+                completion.agent = agent
+                completion.elapsed = time.monotonic() - started
+                return completion
+            except Exception as exc:
+                last_exc = exc
+                with self._lock:
+                    self._cooldown_until[name] = time.monotonic() + COOLDOWN_SECONDS
+                logger.warning(
+                    "LLM provider %s failed for %s after %.1fs: %s",
+                    name, agent, time.monotonic() - started, exc,
+                )
+        raise ProviderError(f"All LLM providers failed for agent {agent!r}.") from last_exc
+
+
+def build_router_from_env() -> LLMRouter:
+    """Create the providers and routes described by the environment."""
+    providers: Dict[str, Provider] = {"mock": MockProvider()}
+    if os.getenv("GROQ_API_KEY"):
+        providers["groq"] = GroqProvider(os.getenv("GROQ_API_KEY"), os.getenv("GROQ_MODEL", DEFAULT_GROQ_MODEL))
+    if os.getenv("LOCAL_LLM_BASE_URL"):
+        providers["local"] = OpenAICompatibleProvider(
+            os.getenv("LOCAL_LLM_BASE_URL"),
+            os.getenv("LOCAL_LLM_MODEL", "local"),
+            os.getenv("LOCAL_LLM_API_KEY"),
+        )
+
+    routes = {"default": parse_route(os.getenv("LLM_ROUTE_DEFAULT", "groq"))}
+    for agent in AGENTS:
+        spec = os.getenv(f"LLM_ROUTE_{agent.upper()}")
+        if spec:
+            routes[agent] = parse_route(spec)
+    return LLMRouter(providers, routes)
+
+
+router = build_router_from_env()
+
+
+def complete(
+    agent: str, messages: List[Dict[str, str]], max_tokens: int, json_mode: bool = False
+) -> Completion:
+    """Run a completion for an agent through the shared router."""
+    return router.complete(agent, messages, max_tokens, json_mode=json_mode)
+
+
+def compact_records(records: List[Dict[str, Any]], columns: List[str]) -> str:
+    """
+    Serialise records as a header plus positional rows, each prefixed with its id.
+
+    Avoids repeating every key for every record in the prompt, e.g.
+    {"columns": ["id", "product", ...], "rows": [[0, "Leite 1L", ...], ...]}.
+
+    Args:
+        records: Record dicts; a record's id is its index in this list.
+        columns: Keys to include, in order.
+
+    Returns:
+        Compact JSON string.
+    """
+    rows = [[i] + [r.get(c) for c in columns] for i, r in enumerate(records)]
+    return json.dumps({"columns": ["id"] + columns, "rows": rows}, ensure_ascii=False, separators=(",", ":"))
@@ -1,24 +1,52 @@
 """
 FastAPI application entry point for the WhatsApp Sales Extractor.
 
-Exposes three endpoints:
-  GET  /health  — liveness probe
+Exposes four endpoints:
+  GET  /health  — liveness probe with event-loop lag, executor pool and cache metrics
   POST /upload  — accepts a WhatsApp .txt export, runs the full agent pipeline,
                   and returns structured sales data as JSON
   POST /export  — accepts a JSON sales payload and streams back an Excel file
+  GET  /profiles/{profile_id} — downloads a saved .prof profiling artifact
+
+Send "X-Profile: 1" with /upload or /export to profile that request.
+
+Blocking work never runs on the event loop: parsing and Excel export go to the
+CPU pool and LLM calls to the I/O pool (see executors.py). A saturated pool
+answers 503.
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Tuple
+
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
 import shutil
 import os
 import tempfile
 
 from agents.orchestrator import Orchestrator
 from excel_writer import write_to_excel
+from executors import PoolSaturated, cpu_pool, io_pool, loop_lag, pool_metrics
+from limits import DEFAULT_LIMITS, LimitExceeded
+from llm import ProviderError
+import profiling
+from result_cache import ResultCache, cache_key
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the loop-lag probe on startup and stop the executor pools on shutdown."""
+    loop_lag.start()
+    yield
+    loop_lag.stop()
+    cpu_pool.shutdown()
+    io_pool.shutdown()
+
 
-app = FastAPI(title="WhatsApp Sales Extractor", version="1.0.0")
+app = FastAPI(title="WhatsApp Sales Extractor", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,54 +57,210 @@ app.add_middleware(
 )
 
 orchestrator = Orchestrator()
+result_cache = ResultCache()
+
+
+# Uploaded files are read back in chunks once the multipart body is parsed
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Allowance for multipart boundaries and part headers on top of MAX_UPLOAD_BYTES
+MULTIPART_OVERHEAD = 16 * 1024
+
+# Request body schema for the docs, since /upload parses its form itself
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+
+async def read_upload(request: Request, max_bytes: int) -> Tuple[str, bytes]:
+    """
+    Read the "file" part of a multipart upload, enforcing the size limit as it arrives.
+
+    An oversized Content-Length is rejected before any of the body is read;
+    otherwise body bytes are counted while they stream in, so an oversized
+    upload is cut off at the limit instead of being spooled to disk first.
+
+    Args:
+        request:   Incoming /upload request.
+        max_bytes: Maximum size of the uploaded file.
+
+    Returns:
+        Tuple of (filename, file contents).
+
+    Raises:
+        LimitExceeded: if the body or the file exceeds the limit.
+        HTTPException 400: if the body is not multipart or has no "file" part.
+    """
+    body_limit = max_bytes + MULTIPART_OVERHEAD
+    too_large = LimitExceeded(f"Upload exceeds the {max_bytes}-byte limit.")
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > body_limit:
+        raise too_large
+
+    async def counted_body() -> AsyncIterator[bytes]:
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > body_limit:
+                raise too_large
+            yield chunk
+
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload.")
+    try:
+        form = await MultiPartParser(request.headers, counted_body()).parse()
+    except MultiPartException as exc:
+        raise HTTPException(status_code=400, detail=exc.message)
+
+    file = form.get("file")
+    if not isinstance(file, UploadFile):
+        raise HTTPException(status_code=400, detail="No file was uploaded.")
+    try:
+        chunks = []
+        size = 0
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise too_large
+            chunks.append(chunk)
+    finally:
+        await form.close()
+    return file.filename or "", b"".join(chunks)
+
+
+def is_complete(result: dict) -> bool:
+    """
+    Return True if a pipeline result is complete enough to cache.
+
+    Degraded (truncated or locally extracted) runs, runs with failed
+    classifier batches and runs where an LLM response could not be parsed
+    are partial; a retry should run the pipeline again.
+    """
+    stats = result.get("stats", {})
+    return not (
+        stats.get("degraded")
+        or stats.get("classifier_failed_batches")
+        or stats.get("llm_parse_failures")
+    )
 
 
 @app.get("/health")
 def health_check():
-    """Return a simple liveness response to confirm the API is running."""
-    return {"status": "ok"}
+    """
+    Return a liveness response plus load metrics for sizing workers.
+
+    Returns:
+        JSON with keys: status ("ok"), loop_lag_ms (last/max event-loop wake-up
+        delay), pools (per-pool concurrency and queue depth) and upload_cache.
+    """
+    return {
+        "status": "ok",
+        "loop_lag_ms": loop_lag.metrics(),
+        "pools": pool_metrics(),
+        "upload_cache": result_cache.stats(),
+    }
 
 
-@app.post("/upload")
-async def upload_chat(file: UploadFile = File(...)):
+@app.post("/upload", openapi_extra=UPLOAD_OPENAPI)
+async def upload_chat(request: Request, x_profile: Optional[str] = Header(None)):
     """
     Accept a WhatsApp exported .txt file and run the full agent pipeline.
 
+    Results are cached by the SHA-256 of the decoded text plus the pipeline
+    fingerprint; identical uploads, including concurrent ones, share one run.
+    Partial results (see is_complete) are not cached.
+    A profiled request bypasses the cache so the pipeline actually runs.
+
     Args:
-        file: Multipart-uploaded .txt file from the client.
+        request:   Request carrying the .txt file in a multipart "file" part.
+        x_profile: "1" to profile this upload (X-Profile header).
 
     Returns:
         JSON with keys: filename (str), sales (list of sale dicts),
-        errors (list of flagged issue dicts).
+        errors (list of flagged issue dicts), stats (pipeline counters),
+        cached (bool, True when served from the upload cache), and, when
+        profiled, profile (timing breakdown and download URL).
 
     Raises:
-        HTTPException 400: if the uploaded file is not a .txt file.
+        HTTPException 400: if no file was uploaded or it is not a .txt file.
+        HTTPException 413: if the file or its message/candidate count exceeds the job limits.
+        HTTPException 429: if the job exhausts its LLM token budget.
+        HTTPException 502: if every LLM provider on an agent's route fails.
+        HTTPException 503: if the CPU or I/O pool is saturated.
     """
-    if not file.filename.endswith(".txt"):
+    try:
+        filename, content = await read_upload(request, DEFAULT_LIMITS.max_bytes)
+    except LimitExceeded as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    if not filename.endswith(".txt"):
         raise HTTPException(status_code=400, detail="Only .txt WhatsApp export files are accepted.")
+    text = content.decode("utf-8", errors="ignore")
 
-    contents = await file.read()
-    text = contents.decode("utf-8", errors="ignore")
+    profile_requested = profiling.wants_profile(x_profile)
+    report = None
 
-    result = await orchestrator.run(text, filename=file.filename)
+    async def run_pipeline():
+        nonlocal report
+        if not profile_requested and profiling.SLOW_UPLOAD_SECONDS <= 0:
+            return await orchestrator.run(text, filename=filename)
+        result, report = await profiling.profile_coroutine(
+            orchestrator.run(text, filename=filename),
+            label=f"upload:{filename}",
+            keep=profile_requested,
+        )
+        if not profile_requested:
+            profiling.log_if_slow(report)
+        return result
 
-    return {"filename": file.filename, "sales": result["sales"], "errors": result.get("errors", [])}
+    try:
+        if profile_requested:
+            result, cached = await run_pipeline(), False
+        else:
+            key = cache_key(text, orchestrator.fingerprint())
+            result, cached = await result_cache.get_or_compute(key, run_pipeline, cacheable=is_complete)
+    except (LimitExceeded, PoolSaturated, ProviderError) as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+    response = {
+        "filename": filename,
+        "sales": result["sales"],
+        "errors": result.get("errors", []),
+        "stats": result.get("stats", {}),
+        "cached": cached,
+    }
+    if profile_requested and report:
+        response["profile"] = {**report.to_dict(), "download": f"/profiles/{report.id}"}
+    return response
 
 
 @app.post("/export")
-async def export_to_excel(payload: dict):
+async def export_to_excel(payload: dict, x_profile: Optional[str] = Header(None)):
     """
     Generate and stream an Excel file from the provided sales data.
 
     Args:
-        payload: JSON body containing a "sales" key with a list of sale dicts.
+        payload:   JSON body containing a "sales" key with a list of sale dicts.
+        x_profile: "1" to profile the workbook build (X-Profile header).
 
     Returns:
         FileResponse streaming the generated .xlsx file with appropriate
-        content-type and download filename headers.
+        content-type and download filename headers. Profiled exports also
+        carry X-Profile-Id and X-Profile-Timing headers.
 
     Raises:
         HTTPException 400: if the sales list is absent or empty.
+        HTTPException 503: if the CPU pool is saturated.
     """
     sales = payload.get("sales", [])
     if not sales:
@@ -85,10 +269,47 @@ async def export_to_excel(payload: dict):
     tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
     tmp.close()
 
-    write_to_excel(sales, tmp.name)
+    headers = {}
+    try:
+        if profiling.wants_profile(x_profile):
+            _, report = await cpu_pool.run(
+                profiling.profile_call, write_to_excel, sales, tmp.name, label="export"
+            )
+            headers["X-Profile-Id"] = report.id
+            headers["X-Profile-Timing"] = (
+                f"wall={report.wall_seconds};cpu={report.cpu_seconds};"
+                f"blocking_io={report.blocking_io_seconds};awaited={report.awaited_seconds};"
+                f"profiled={int(report.profiled)}"
+            )
+        else:
+            await cpu_pool.run(write_to_excel, sales, tmp.name)
+    except PoolSaturated as exc:
+        os.remove(tmp.name)
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
 
     return FileResponse(
         tmp.name,
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         filename="sales_export.xlsx",
+        headers=headers,
     )
+
+
+@app.get("/profiles/{profile_id}")
+def download_profile(profile_id: str):
+    """
+    Download a saved cProfile artifact for snakeviz/flameprof.
+
+    Args:
+        profile_id: Id returned in an upload's profile block or X-Profile-Id.
+
+    Returns:
+        FileResponse streaming the .prof file.
+
+    Raises:
+        HTTPException 404: if no artifact exists for the id.
+    """
+    path = profiling.artifact_path(profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
@@ -0,0 +1,219 @@
+"""
+Locale-aware price and quantity parsing.
+
+Handles the number formats seen in sales chats without an LLM call:
+  - thousands/decimal separators in either convention ("1.234,56", "1,234.56",
+    "1 234,56"), resolved per chat by detect_decimal_separator() when a value
+    is ambiguous
+  - Arabic-Indic and Persian digits and the Arabic decimal/thousands marks
+  - currency symbols and codes, including LBP/AED/SAR and their Arabic forms;
+    codes that are also ordinary words ("SR", "REAL") must be upper-case
+  - "k" / "mil" / "mi" / "million" / "ألف" multipliers
+
+Run this module directly for a parsing throughput benchmark.
+"""
+
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+# Arabic-Indic (U+0660–0669) and Extended/Persian (U+06F0–06F9) digits to ASCII;
+# the Arabic decimal separator becomes "." and the Arabic thousands separator is
+# dropped, since it is never a decimal mark
+_DIGIT_TABLE = str.maketrans(
+    {**{chr(0x0660 + i): str(i) for i in range(10)},
+     **{chr(0x06F0 + i): str(i) for i in range(10)},
+     "٫": ".", "٬": None}
+)
+
+# Currency symbols/codes mapped to ISO 4217 codes. Longer spellings come first
+# in CURRENCY_PATTERN so "US$" wins over "$" and "R$" over "$".
+CURRENCY_CODES = {
+    "R$": "BRL", "BRL": "BRL", "REAIS": "BRL", "REAL": "BRL",
+    "US$": "USD", "USD": "USD", "$": "USD",
+    "€": "EUR", "EUR": "EUR",
+    "£": "GBP", "GBP": "GBP",
+    "LBP": "LBP", "L.L.": "LBP", "L.L": "LBP", "LL": "LBP", "ل.ل.": "LBP", "ل.ل": "LBP",
+    "AED": "AED", "DHS": "AED", "DH": "AED", "د.إ.": "AED", "د.إ": "AED",
+    "SAR": "SAR", "SR": "SAR", "ر.س.": "SAR", "ر.س": "SAR",
+}
+
+# Aliases that are also ordinary words ("Sr. Joao", "Real Madrid"); they only
+# match upper-case and right next to a number (see AMOUNT_RE)
+WORD_LIKE_ALIASES = {"SR", "REAL", "DH", "DHS", "LL"}
+
+
+def _currency_pattern(codes: Iterable[str]) -> str:
+    """Build a regex alternation of currency codes, longest first; word-like ones case-sensitive."""
+    return "|".join(
+        f"(?-i:{re.escape(c)})" if c in WORD_LIKE_ALIASES else re.escape(c)
+        for c in sorted(codes, key=len, reverse=True)
+    )
+
+
+# Every currency marker, for use next to an amount
+CURRENCY_PATTERN = _currency_pattern(CURRENCY_CODES)
+
+# Markers that are safe to recognise on their own, away from any number
+STANDALONE_CURRENCY_PATTERN = _currency_pattern(set(CURRENCY_CODES) - WORD_LIKE_ALIASES)
+
+# Multiplier suffixes; matched case-insensitively and must not run into a word
+MULTIPLIERS = {
+    "k": 1e3, "mil": 1e3, "ألف": 1e3, "الف": 1e3,
+    "mi": 1e6, "mln": 1e6, "million": 1e6, "millions": 1e6,
+    "milhão": 1e6, "milhao": 1e6, "milhões": 1e6, "milhoes": 1e6,
+}
+
+_MULTIPLIER_PATTERN = "|".join(
+    re.escape(m) for m in sorted(MULTIPLIERS, key=len, reverse=True)
+)
+
+# Digits with optional separators: "1.234,56", "1\u00a0234,56", "1'234.56", "12",
+# including the Arabic decimal/thousands marks when matched on untranslated text.
+# An ordinary space only separates whole three-digit groups ("1 234,56") not
+# followed by a letter, so "2 500g" stays a quantity and a weight.
+_NUMBER_PATTERN = (
+    r"\d{1,3}(?: \d{3})+(?:[.,]\d+)?(?!\w)"
+    r"|\d(?:[\d.,'\u00a0\u202f\u066b\u066c]*\d)?"
+)
+
+AMOUNT_RE = re.compile(
+    rf"(?:(?<![^\W\d_])(?P<pre>{CURRENCY_PATTERN}))?\s*"
+    rf"(?P<num>-?{_NUMBER_PATTERN})"
+    rf"(?:\s*(?P<mult>{_MULTIPLIER_PATTERN})(?![^\W\d_]))?"
+    rf"(?:\s*(?P<post>{CURRENCY_PATTERN})(?![^\W\d_]))?",
+    re.IGNORECASE,
+)
+
+# Evidence for the chat's decimal separator: "12,50" / "1.234,5" vs "12.50" / "1,234.5"
+_COMMA_DECIMAL_RE = re.compile(r"(?<![\d.,])\d+(?:\.\d{3})*,\d{1,2}(?![\d.,])")
+_DOT_DECIMAL_RE = re.compile(r"(?<![\d.,])\d+(?:,\d{3})*\.\d{1,2}(?![\d.,])")
+
+
+@dataclass
+class Amount:
+    """
+    A parsed numeric value with its currency, if one was written.
+
+    Attributes:
+        value:    Numeric value with any multiplier applied.
+        currency: ISO 4217 code, or None when no currency marker was found.
+    """
+    value: float
+    currency: Optional[str] = None
+
+
+def to_ascii_digits(text: str) -> str:
+    """Translate Arabic-Indic/Persian digits and Arabic separators to ASCII."""
+    return text.translate(_DIGIT_TABLE)
+
+
+def normalize_currency(raw: Optional[str]) -> Optional[str]:
+    """
+    Map a currency symbol or code to its ISO 4217 code.
+
+    Unknown values are returned upper-cased and stripped; empty values give None.
+    """
+    if not raw:
+        return None
+    key = raw.strip().upper()
+    return CURRENCY_CODES.get(key, CURRENCY_CODES.get(raw.strip(), key or None))
+
+
+def _to_float(num: str, decimal_sep: Optional[str]) -> float:
+    """
+    Convert a digit string with separators to a float.
+
+    When both "." and "," appear the last one is the decimal separator; a
+    separator repeated more than once is a thousands separator. A single
+    separator followed by exactly three digits is ambiguous and is resolved by
+    decimal_sep, defaulting to a thousands separator.
+    """
+    s = num.replace(" ", "").replace("\u00a0", "").replace("\u202f", "").replace("'", "")
+    dots, commas = s.count("."), s.count(",")
+    if dots and commas:
+        dec = "." if s.rfind(".") > s.rfind(",") else ","
+    elif dots > 1 or commas > 1:
+        dec = None
+    elif dots or commas:
+        sep = "." if dots else ","
+        frac = s.rsplit(sep, 1)[1]
+        dec = None if len(frac) == 3 and decimal_sep != sep else sep
+    else:
+        dec = None
+
+    if dec is None:
+        return float(s.replace(".", "").replace(",", ""))
+    thousands = "," if dec == "." else "."
+    return float(s.replace(thousands, "").replace(dec, "."))
+
+
+def parse_amount(raw: str, decimal_sep: Optional[str] = None) -> Optional[Amount]:
+    """
+    Parse the first amount in a string.
+
+    Args:
+        raw:         Text such as "R$ 1.234,56", "AED 2.5k", "١٢٫٥ ر.س" or "3 mil".
+        decimal_sep: The chat's decimal separator ("," or "."), used only for
+                     ambiguous values such as "1.500"; see detect_decimal_separator.
+
+    Returns:
+        Amount, or None if the string holds no number.
+    """
+    text = to_ascii_digits(raw)
+    if "٫" in raw:
+        decimal_sep = "."
+    match = AMOUNT_RE.search(text)
+    if not match:
+        return None
+    try:
+        value = _to_float(match.group("num"), decimal_sep)
+    except ValueError:
+        return None
+    mult = match.group("mult")
+    if mult:
+        value *= MULTIPLIERS[mult.lower()]
+    currency = match.group("pre") or match.group("post")
+    return Amount(value=value, currency=normalize_currency(currency))
+
+
+def parse_number(raw: str, decimal_sep: Optional[str] = None) -> Optional[float]:
+    """Parse the first amount in a string and return only its value, or None."""
+    amount = parse_amount(raw, decimal_sep)
+    return amount.value if amount else None
+
+
+def detect_decimal_separator(texts: Iterable[str]) -> Optional[str]:
+    """
+    Guess a chat's decimal separator from unambiguous numbers in its messages.
+
+    Args:
+        texts: Message texts from one chat.
+
+    Returns:
+        "," or "." when the chat leans clearly one way, otherwise None.
+    """
+    votes: Counter = Counter()
+    for text in texts:
+        text = to_ascii_digits(text)
+        votes[","] += len(_COMMA_DECIMAL_RE.findall(text))
+        votes["."] += len(_DOT_DECIMAL_RE.findall(text))
+    if votes[","] == votes["."]:
+        return None
+    return "," if votes[","] > votes["."] else "."
+
+
+if __name__ == "__main__":
+    import timeit
+
+    samples = [
+        "R$ 1.234,56", "$1,234.56", "12,50", "AED 2.5k", "3 mil", "١٢٫٥ ر.س",
+        "LBP 150.000", "ل.ل ٢٠٠٠٠٠", "SAR 99", "1 234,56 €", "£7.99", "45",
+    ]
+    runs = 20_000
+    seconds = timeit.timeit(lambda: [parse_amount(s) for s in samples], number=runs)
+    total = runs * len(samples)
+    print(f"{total} parses in {seconds:.2f}s — {total / seconds:,.0f} parses/s")
+    for s in samples:
+        print(f"{s!r:>16} → {parse_amount(s)}")
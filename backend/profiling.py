@@ -0,0 +1,413 @@
+"""
+Opt-in profiling for slow uploads and exports.
+
+A profiled call is run under cProfile and its wall time is split into:
+  cpu_seconds         — CPU time spent running this request's own code, on the
+                        event loop and in executor pool workers
+  blocking_io_seconds — time this request blocked the event loop without using
+                        CPU (e.g. synchronous I/O made directly on the loop)
+  awaited_seconds     — time spent suspended at an await without this request
+                        using CPU (LLM API waits on the I/O pool, queueing for
+                        a pool worker, other requests on the loop)
+
+Work a coroutine hands to the executor pools (parse_chat and the regex
+pre-filter on the CPU pool, LLM calls on the I/O pool) runs off the loop
+thread. How it is profiled depends on the Python version:
+
+  Python 3.11 and older — profilers are per thread. The request's profiler is
+      enabled only while the coroutine itself is executing, so concurrent
+      requests on the same loop do not pollute each other's profiles, and
+      each pool call runs under its own profiler in the worker (see
+      run_profiled) whose stats are merged into the request's report.
+  Python 3.12 and newer — only one profiler may be active per process and it
+      sees every thread. A profiled request holds that single profiler for
+      its whole run, pool workers included; its stats may therefore include
+      other requests running at the same time. A request that starts while
+      another holds the profiler (or while another profiling tool is active)
+      is timed but not profiled, and its report has profiled=False.
+
+Pool CPU time is measured in the worker in both cases. Each profile is saved
+as a .prof artifact (open it with snakeviz, or render a flamegraph with
+flameprof) next to a text summary.
+
+Profiling is triggered per request (X-Profile: 1 header) or for every call
+when PROFILE_ALL=1. With SLOW_UPLOAD_SECONDS set, every upload is profiled and
+the artifact is kept and logged only when the upload exceeds the threshold.
+"""
+
+import contextvars
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import types
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ALL = os.getenv("PROFILE_ALL", "").lower() in ("1", "true", "yes")
+SLOW_UPLOAD_SECONDS = float(os.getenv("SLOW_UPLOAD_SECONDS", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "whatsapp-sales-profiles"))
+
+# Number of saved profiles kept on disk; older ones are deleted
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+
+# Functions listed in each text summary
+SUMMARY_LINES = 30
+
+# Python 3.12+ runs cProfile on sys.monitoring: one active profiler per
+# process, covering all threads
+SINGLE_PROFILER = sys.version_info >= (3, 12)
+
+# Held by the request that owns the process-wide profiler (SINGLE_PROFILER only)
+_profiler_lock = threading.Lock()
+
+# Profile stats whose artifacts have not been written (or discarded) yet
+_pending: Dict[str, pstats.Stats] = {}
+
+
+def _try_enable(profiler: cProfile.Profile) -> bool:
+    """Enable a profiler; return False instead of raising if another one is active."""
+    try:
+        profiler.enable()
+        return True
+    except ValueError:
+        return False
+
+
+def _stats(profiler: cProfile.Profile) -> pstats.Stats:
+    """Return a profiler's stats; empty stats if it recorded nothing (pstats raises then)."""
+    try:
+        return pstats.Stats(profiler)
+    except TypeError:
+        return pstats.Stats()
+
+
+class PoolProfiles:
+    """Stats and CPU time collected from executor pool calls of one profiled coroutine."""
+
+    def __init__(self, profile_threads: bool = True):
+        """
+        Args:
+            profile_threads: Profile calls on thread pools in the worker. False
+                             when the request's own profiler already covers
+                             every thread (SINGLE_PROFILER).
+        """
+        self.profile_threads = profile_threads
+        self.stats: List[Dict[Any, Any]] = []
+        self.cpu = 0.0
+
+    def unpack(self, packed: Tuple[Any, Dict[Any, Any], float]) -> Any:
+        """Record the output of run_profiled and return the call's own result."""
+        result, stats, cpu = packed
+        self.stats.append(stats)
+        self.cpu += cpu
+        return result
+
+
+# Collector for the profiled coroutine running in this context, if any
+_pool_profiles: contextvars.ContextVar[Optional[PoolProfiles]] = contextvars.ContextVar(
+    "pool_profiles", default=None
+)
+
+
+def pool_profiles() -> Optional[PoolProfiles]:
+    """Return the collector executor pools should report to, or None when not profiling."""
+    return _pool_profiles.get()
+
+
+def run_profiled(call: Callable[[], Any], profile: bool = True) -> Tuple[Any, Dict[Any, Any], float]:
+    """
+    Run a zero-argument call in a pool worker, timing it and optionally profiling it.
+
+    Module-level and returning plain data so it also works in process pools.
+    If another profiler is already active (Python 3.12+ allows only one per
+    process), the call runs unprofiled and only its CPU time is reported.
+
+    Args:
+        call:    The pool call.
+        profile: Run it under its own profiler; False only measures CPU time.
+
+    Returns:
+        Tuple of (call result, raw pstats dict, thread CPU seconds).
+    """
+    profiler = cProfile.Profile()
+    cpu0 = time.thread_time()
+    enabled = profile and _try_enable(profiler)
+    try:
+        result = call()
+    finally:
+        if enabled:
+            profiler.disable()
+    cpu = time.thread_time() - cpu0
+    return result, _stats(profiler).stats if enabled else {}, cpu
+
+
+class _RawStats:
+    """Adapter letting pstats load a raw stats dict returned by run_profiled."""
+
+    def __init__(self, stats: Dict[Any, Any]):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+@dataclass
+class ProfileReport:
+    """
+    Timing breakdown and artifact location for one profiled call.
+
+    Attributes:
+        id:                  Identifier used to download the artifact.
+        label:               What was profiled, e.g. "upload:chat.txt".
+        wall_seconds:        End-to-end elapsed time.
+        cpu_seconds:         CPU time spent in the call's own code.
+        blocking_io_seconds: Time the call blocked its thread without CPU use.
+        awaited_seconds:     Time spent suspended at awaits.
+        profiled:            False if another profiler was active, so only
+                             timings were collected.
+        path:                Path of the saved .prof file ("" if not kept).
+    """
+    id: str
+    label: str
+    wall_seconds: float
+    cpu_seconds: float
+    blocking_io_seconds: float
+    awaited_seconds: float
+    profiled: bool = True
+    path: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the report as a JSON-serialisable dict without the local path."""
+        data = asdict(self)
+        data.pop("path")
+        return data
+
+
+def wants_profile(header_value: Optional[str]) -> bool:
+    """Return True if the request header or PROFILE_ALL asks for profiling."""
+    if PROFILE_ALL:
+        return True
+    return (header_value or "").lower() in ("1", "true", "yes")
+
+
+@types.coroutine
+def _step_timed(coro: Coroutine, profiler: Optional[cProfile.Profile], totals: Dict[str, float]):
+    """
+    Drive a coroutine step by step, timing (and optionally profiling) only its own loop-thread execution.
+
+    Each send()/throw() into the coroutine is charged to totals["cpu"] (thread
+    CPU time) and totals["step_wall"] (wall time); time between steps is time
+    spent awaiting. When a profiler is given it is enabled for each step; a
+    step during which another profiler is active runs unprofiled and sets
+    totals["unprofiled"].
+    """
+    value: Any = None
+    error: Optional[BaseException] = None
+    while True:
+        wall0, cpu0 = time.perf_counter(), time.thread_time()
+        enabled = profiler is not None and _try_enable(profiler)
+        if profiler is not None and not enabled:
+            totals["unprofiled"] = 1
+        try:
+            if error is not None:
+                yielded = coro.throw(error)
+            else:
+                yielded = coro.send(value)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            if enabled:
+                profiler.disable()
+            totals["cpu"] += time.thread_time() - cpu0
+            totals["step_wall"] += time.perf_counter() - wall0
+        try:
+            value, error = (yield yielded), None
+        except BaseException as exc:  # Forward cancellation and errors into the coroutine
+            value, error = None, exc
+
+
+async def profile_coroutine(coro: Coroutine, label: str, keep: bool = True) -> Tuple[Any, ProfileReport]:
+    """
+    Await a coroutine under the profiler.
+
+    Args:
+        coro:  Coroutine to run, e.g. orchestrator.run(text).
+        label: Description stored with the artifact.
+        keep:  Save the artifact; when False the caller may save it later with save().
+
+    Returns:
+        Tuple of (coroutine result, ProfileReport).
+    """
+    profiler = cProfile.Profile()
+    totals = {"cpu": 0.0, "step_wall": 0.0, "unprofiled": 0}
+    step_profiler: Optional[cProfile.Profile] = profiler
+    held = False
+    if SINGLE_PROFILER:
+        # One profiler for the whole run; it also sees the pool threads
+        step_profiler = None
+        held = _profiler_lock.acquire(blocking=False)
+        if held and not _try_enable(profiler):
+            _profiler_lock.release()
+            held = False
+        if not held:
+            totals["unprofiled"] = 1
+    pool = PoolProfiles(profile_threads=not SINGLE_PROFILER)
+    started = time.perf_counter()
+    token = _pool_profiles.set(pool)
+    try:
+        result = await _step_timed(coro, step_profiler, totals)
+    finally:
+        _pool_profiles.reset(token)
+        if held:
+            profiler.disable()
+            _profiler_lock.release()
+    totals["pool_cpu"] = pool.cpu
+    report = _report(label, started, totals)
+    stats = _stats(profiler)
+    for raw in pool.stats:
+        if raw:
+            stats.add(_RawStats(raw))
+    _pending[report.id] = stats
+    if keep:
+        save(report)
+    return result, report
+
+
+def profile_call(func: Callable[..., Any], *args: Any, label: str, **kwargs: Any) -> Tuple[Any, ProfileReport]:
+    """
+    Run a synchronous function under the profiler and save the artifact.
+
+    Args:
+        func:  Callable to run, e.g. write_to_excel.
+        label: Description stored with the artifact.
+
+    Returns:
+        Tuple of (function result, ProfileReport).
+    """
+    profiler = cProfile.Profile()
+    held = SINGLE_PROFILER and _profiler_lock.acquire(blocking=False)
+    enabled = (held or not SINGLE_PROFILER) and _try_enable(profiler)
+    started, cpu0 = time.perf_counter(), time.thread_time()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - started
+        if enabled:
+            profiler.disable()
+        if held:
+            _profiler_lock.release()
+    totals = {"cpu": time.thread_time() - cpu0, "step_wall": elapsed, "unprofiled": 0 if enabled else 1}
+    report = _report(label, started, totals)
+    _pending[report.id] = _stats(profiler)
+    save(report)
+    return result, report
+
+
+def _report(label: str, started: float, totals: Dict[str, float]) -> ProfileReport:
+    """
+    Build a ProfileReport from accumulated timings.
+
+    totals holds loop-thread "cpu" and "step_wall" seconds, an "unprofiled"
+    flag and, for coroutines, "pool_cpu": CPU seconds spent in executor pool
+    calls, which is moved out of the awaited time and into cpu_seconds.
+    """
+    wall = time.perf_counter() - started
+    pool_cpu = totals.get("pool_cpu", 0.0)
+    return ProfileReport(
+        id=uuid.uuid4().hex,
+        label=label,
+        wall_seconds=round(wall, 4),
+        cpu_seconds=round(totals["cpu"] + pool_cpu, 4),
+        blocking_io_seconds=round(max(totals["step_wall"] - totals["cpu"], 0.0), 4),
+        awaited_seconds=round(max(wall - totals["step_wall"] - pool_cpu, 0.0), 4),
+        profiled=not totals.get("unprofiled"),
+    )
+
+
+def save(report: ProfileReport) -> str:
+    """
+    Write a report's .prof artifact and text summary to PROFILE_DIR.
+
+    Older artifacts beyond PROFILE_KEEP are deleted.
+
+    Returns:
+        Path of the .prof file.
+    """
+    stats = _pending.pop(report.id)
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    report.path = os.path.join(PROFILE_DIR, f"{report.id}.prof")
+    stats.dump_stats(report.path)
+    with open(os.path.join(PROFILE_DIR, f"{report.id}.txt"), "w", encoding="utf-8") as f:
+        f.write(f"{report.label}\n{report.to_dict()}\n\n")
+        f.write(summarize(stats))
+    _prune()
+    return report.path
+
+
+def discard(report: ProfileReport) -> None:
+    """Drop an unsaved report's profile data."""
+    _pending.pop(report.id, None)
+
+
+def summarize(stats: pstats.Stats, lines: int = SUMMARY_LINES) -> str:
+    """Return the top functions by cumulative time as text."""
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats("cumulative").print_stats(lines)
+    return out.getvalue()
+
+
+def artifact_path(profile_id: str) -> Optional[str]:
+    """
+    Return the path of a saved .prof artifact, or None if it does not exist.
+
+    Only hex ids generated by this module are accepted.
+    """
+    if not profile_id.isalnum():
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.prof")
+    return path if os.path.exists(path) else None
+
+
+def log_if_slow(report: ProfileReport, threshold: float = SLOW_UPLOAD_SECONDS) -> bool:
+    """
+    Keep and log the profile of a call slower than threshold; discard it otherwise.
+
+    Returns:
+        True if the call was slow and its artifact was saved.
+    """
+    if threshold <= 0 or report.wall_seconds < threshold:
+        discard(report)
+        return False
+    save(report)
+    logger.warning(
+        "Slow %s: %.1fs wall (cpu %.1fs, blocking I/O %.1fs, awaited %.1fs) — profile %s",
+        report.label, report.wall_seconds, report.cpu_seconds,
+        report.blocking_io_seconds, report.awaited_seconds, report.path,
+    )
+    return True
+
+
+def _prune() -> None:
+    """Delete the oldest artifacts beyond PROFILE_KEEP."""
+    profiles = sorted(
+        (os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR) if name.endswith(".prof")),
+        key=os.path.getmtime,
+    )
+    for path in profiles[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else []:
+        for artifact in (path, path[:-len(".prof")] + ".txt"):
+            if os.path.exists(artifact):
+                os.remove(artifact)
@@ -0,0 +1,139 @@
+"""
+Upload-level result cache keyed on the content hash of the decoded chat text.
+
+Identical uploads (client retries, several managers sending the same group
+chat) are answered from memory instead of re-running the agent pipeline.
+Concurrent requests for the same key share one in-flight pipeline run.
+Partial results (see get_or_compute's cacheable argument) are returned to the
+requests that shared the run but are not stored, so a retry runs again.
+
+Storage is bounded by entry count (UPLOAD_CACHE_SIZE) and approximate
+serialised size (UPLOAD_CACHE_MAX_BYTES); the least recently used entries are
+evicted first. Setting UPLOAD_CACHE_SIZE=0 disables caching.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("UPLOAD_CACHE_SIZE", "128"))
+DEFAULT_MAX_BYTES = int(os.getenv("UPLOAD_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def cache_key(text: str, fingerprint: str) -> str:
+    """
+    Build the cache key for an upload.
+
+    Args:
+        text:        Decoded chat text.
+        fingerprint: Pipeline version and configuration fingerprint.
+
+    Returns:
+        Hex SHA-256 of the text, suffixed with a short hash of the fingerprint.
+    """
+    content = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    config = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+    return f"{content}:{config}"
+
+
+class ResultCache:
+    """LRU cache of pipeline results with in-flight request coalescing."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            max_entries: Maximum number of cached results (0 disables the cache).
+            max_bytes:   Maximum total approximate size of cached results.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.uncacheable = 0
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Dict[str, Any]]],
+        cacheable: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Return the cached result for key, computing it at most once.
+
+        If another request is already computing the same key, this call waits
+        for that run instead of starting a new one. The shared run is shielded,
+        so a disconnecting client does not cancel it for the others. Failures,
+        and results rejected by cacheable, are not cached.
+
+        Args:
+            key:       Cache key from cache_key().
+            compute:   Zero-argument coroutine function producing the result.
+            cacheable: Optional predicate; results for which it returns False
+                       are not stored.
+
+        Returns:
+            Tuple of (result, cached) where cached is True when no new pipeline
+            run was started for this call.
+        """
+        if self.max_entries <= 0:
+            return await compute(), False
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], True
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), True
+
+        self.misses += 1
+        task = asyncio.ensure_future(compute())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._finish(key, t, cacheable))
+        return await asyncio.shield(task), False
+
+    def _finish(
+        self, key: str, task: asyncio.Task, cacheable: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ) -> None:
+        """Store a finished run's result and drop it from the in-flight table."""
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if cacheable is not None and not cacheable(result):
+            self.uncacheable += 1
+            return
+        size = len(json.dumps(result, ensure_ascii=False, default=str))
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (result, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters for monitoring."""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "uncacheable": self.uncacheable,
+        }
@@ -0,0 +1,42 @@
+"""
+Shared fixtures for the backend tests.
+
+Every agent is routed to the offline mock provider, so the tests never reach
+a real LLM. Run from backend/: python -m pytest
+"""
+
+import os
+import sys
+
+os.environ["LLM_ROUTE_DEFAULT"] = "mock"
+os.environ.setdefault("UPLOAD_CACHE_SIZE", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import llm
+from executors import cpu_pool, io_pool
+
+
+@pytest.fixture
+def mock_llm(monkeypatch):
+    """
+    Install a MockProvider answering with the given responder.
+
+    Usage: mock_llm(lambda messages: '{"sales": []}'). Returns the provider so
+    tests can inspect its calls.
+    """
+    def install(responder):
+        provider = llm.MockProvider(responder)
+        monkeypatch.setitem(llm.router.providers, "mock", provider)
+        return provider
+
+    return install
+
+
+@pytest.fixture(autouse=True)
+def fresh_pools():
+    """Reset the executor pools after each test; their semaphores bind to one event loop."""
+    yield
+    cpu_pool.shutdown()
+    io_pool.shutdown()
@@ -0,0 +1,42 @@
+import asyncio
+import json
+
+from agents.bug_checker import BugChecker
+
+
+def _sale(timestamp, sender, product, quantity=10, unit_price=5.0):
+    return {
+        "timestamp": timestamp, "sender": sender, "product": product,
+        "quantity": quantity, "unit_price": unit_price,
+        "total_price": quantity * unit_price, "currency": "BRL", "notes": "",
+    }
+
+
+def test_repeat_sale_by_another_sender_is_not_a_repost():
+    sales = [
+        _sale("01/01/2025, 10:00", "Ana", "Leite 1L caixa"),
+        _sale("05/01/2025, 10:00", "Bruno", "Leite 1L caixa", quantity=3),
+    ]
+    result = BugChecker().run_local(sales)
+    assert len(result["sales"]) == 2
+    assert result["errors"] == []
+
+
+def test_reposts_are_kept_and_left_out_of_the_audit(mock_llm):
+    sales = [
+        _sale("01/01/2025, 10:00", "Ana", "Leite 1L caixa"),
+        _sale("01/01/2025, 11:30", "Ana", "Leite 1L cx caixa"),
+    ]
+    # An auditor that removes and flags every record it is shown
+    provider = mock_llm(lambda messages: json.dumps(
+        {"remove": list(range(10)), "errors": [[i, "duplicate"] for i in range(10)]}
+    ))
+
+    result = asyncio.run(BugChecker().run(sales))
+
+    audited = json.loads(provider.calls[0][1]["content"])
+    assert len(audited["rows"]) == 1
+    assert result["sales"] == [sales[1]]
+    repost_errors = [e for e in result["errors"] if e.get("record") is sales[1]]
+    assert len(repost_errors) == 1
+    assert repost_errors[0]["reason"].startswith("Suspected repost")
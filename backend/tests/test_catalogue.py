@@ -0,0 +1,31 @@
+import pytest
+
+from catalogue import CatalogueEntry, ProductCatalogue, product_key
+
+
+@pytest.fixture
+def catalogue():
+    return ProductCatalogue([
+        CatalogueEntry("A5", "Arroz 5kg"),
+        CatalogueEntry("A1", "Arroz Tipo 1 1kg"),
+        CatalogueEntry("L1", "Leite 1L caixa", aliases=["cx leite 1 litro"]),
+    ])
+
+
+def test_product_key_merges_units_and_ignores_order():
+    assert product_key("Leite 1 litro caixa") == product_key("cx leite 1L")
+
+
+@pytest.mark.parametrize("raw, sku", [
+    ("arroz 5 quilos", "A5"),
+    ("Arrozz 5kg", "A5"),
+    ("Leite 1 litro caixa", "L1"),
+    ("leitte 1l cx", "L1"),
+])
+def test_spelling_variants_resolve(catalogue, raw, sku):
+    assert catalogue.resolve(raw).sku == sku
+
+
+@pytest.mark.parametrize("raw", ["Arroz 1kg", "Leite 2L caixa"])
+def test_pack_size_must_match(catalogue, raw):
+    assert catalogue.resolve(raw) is None
@@ -0,0 +1,29 @@
+import pytest
+
+from extractor import candidates_to_sales, extract_sales_candidates
+from parser import parse_chat
+
+
+def _local_sale(text):
+    chat = f"01/01/2025, 10:00 - Ana: {text}"
+    candidates = extract_sales_candidates(parse_chat(chat))
+    [sale] = candidates_to_sales(candidates, ",")
+    return sale
+
+
+@pytest.mark.parametrize("text", ["Leite 2 cx, entrega 10-12h", "Leite 2 cx às 10:30", "3 sacos de arroz"])
+def test_local_fallback_does_not_invent_a_price(text):
+    sale = _local_sale(text)
+    assert sale["unit_price"] is None
+    assert sale["total_price"] is None
+
+
+@pytest.mark.parametrize("text, unit_price, currency", [
+    ("Leite 2 cx R$ 5,00", 5.0, "BRL"),
+    ("Leite 2 cx a 5,00", 5.0, None),
+    ("٣ حبات ١٬٥٠٠ ل.ل", 1500.0, "LBP"),
+])
+def test_local_fallback_reads_prices(text, unit_price, currency):
+    sale = _local_sale(text)
+    assert sale["unit_price"] == unit_price
+    assert sale["currency"] == currency
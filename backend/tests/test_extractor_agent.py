@@ -0,0 +1,43 @@
+import asyncio
+import json
+
+import pytest
+
+from agents.extractor_agent import ExtractorAgent
+from limits import JobBudget, current_budget
+
+CANDIDATE = {
+    "timestamp": "01/01/2025, 10:00", "sender": "Ana", "text": "vendi 2 leite R$ 5,00",
+    "hint_prices": ["R$ 5,00"], "hint_quantities": [],
+}
+
+
+def _extract(candidates):
+    budget = JobBudget(max_tokens=100_000)
+
+    async def run():
+        token = current_budget.set(budget)
+        try:
+            return await ExtractorAgent().extract(candidates)
+        finally:
+            current_budget.reset(token)
+
+    return asyncio.run(run()), budget
+
+
+@pytest.mark.parametrize("content", ['{"sales": null}', '{"sales": {"1": "x"}}', '["sales"]', "not json"])
+def test_malformed_sales_are_recorded_as_parse_failures(mock_llm, content):
+    mock_llm(lambda messages: content)
+    sales, budget = _extract([CANDIDATE])
+    assert sales == []
+    assert budget.parse_failures == {"extractor": 1}
+
+
+def test_rows_are_rehydrated_with_timestamp_and_sender(mock_llm):
+    mock_llm(lambda messages: json.dumps({"sales": [[1, "Leite", 2, 5.0, 10.0, "BRL", ""], [9, "x"]]}))
+    sales, budget = _extract([CANDIDATE])
+    assert sales == [{
+        "timestamp": "01/01/2025, 10:00", "sender": "Ana", "product": "Leite", "quantity": 2,
+        "unit_price": 5.0, "total_price": 10.0, "currency": "BRL", "notes": "",
+    }]
+    assert budget.parse_failures == {}
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from agents.parser_agent import ParserAgent
+from limits import JobBudget, TokenBudgetExceeded, current_budget, reserve_budget
+from llm import Completion
+
+
+def test_reservation_covers_the_completion_cap():
+    budget = JobBudget(max_tokens=2000)
+    token = current_budget.set(budget)
+    try:
+        with reserve_budget("x" * 400, 1024):
+            assert budget.reserved == 101 + 1024
+            # A second call of the same size no longer fits alongside the first
+            with pytest.raises(TokenBudgetExceeded):
+                reserve_budget("x" * 400, 1024)
+    finally:
+        current_budget.reset(token)
+    assert budget.reserved == 0
+    assert budget.used == 0
+
+
+def test_settle_charges_actual_usage_and_frees_the_rest():
+    budget = JobBudget(max_tokens=5000)
+    token = current_budget.set(budget)
+    try:
+        with reserve_budget("prompt", 4096) as reservation:
+            reservation.settle(Completion(content="{}", total_tokens=120, agent="extractor"))
+    finally:
+        current_budget.reset(token)
+    assert budget.used == 120
+    assert budget.reserved == 0
+    assert budget.per_agent["extractor"]["tokens"] == 120
+
+
+def test_concurrent_classifier_batches_stay_within_budget(mock_llm):
+    calls = []
+    lock = threading.Lock()
+
+    def responder(messages):
+        with lock:
+            calls.append(messages)
+        time.sleep(0.05)  # Keep calls in flight together
+        return json.dumps({"sale": []})
+
+    mock_llm(responder)
+    messages = [
+        {"timestamp": "01/01/2025, 10:00", "sender": "Ana", "text": f"mensagem numero {i}"}
+        for i in range(400)
+    ]
+    # Room for two classifier calls (prompt + 1024-token cap each), not eight
+    budget = JobBudget(max_tokens=2 * (1024 + 800))
+
+    async def run():
+        token = current_budget.set(budget)
+        try:
+            await ParserAgent().classify_messages(messages)
+        finally:
+            current_budget.reset(token)
+
+    with pytest.raises(TokenBudgetExceeded):
+        asyncio.run(run())
+    assert 1 <= len(calls) <= 2
+    assert budget.used <= budget.max_tokens
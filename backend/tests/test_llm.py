@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+import pytest
+
+from llm import GroqProvider
+
+
+class _FakeCompletions:
+    def __init__(self):
+        self.kwargs = None
+
+    def create(self, **kwargs):
+        self.kwargs = kwargs
+        message = SimpleNamespace(content="{}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@pytest.fixture
+def groq():
+    pytest.importorskip("groq")
+    provider = GroqProvider(api_key="test")
+    provider.client = SimpleNamespace(chat=SimpleNamespace(completions=_FakeCompletions()))
+    return provider
+
+
+@pytest.mark.parametrize("model, sends_effort", [
+    (None, True),
+    ("qwen/qwen3-32b", True),
+    ("llama-3.3-70b-versatile", False),
+])
+def test_reasoning_effort_only_for_models_that_accept_it(groq, model, sends_effort):
+    groq.complete([{"role": "user", "content": "hi"}], max_tokens=10, model=model)
+    kwargs = groq.client.chat.completions.kwargs
+    assert ("reasoning_effort" in kwargs) is sends_effort
@@ -0,0 +1,79 @@
+import asyncio
+import cProfile
+import json
+import threading
+import time
+
+import httpx
+import pytest
+
+import main
+import profiling
+
+
+class ExclusiveProfile(cProfile.Profile):
+    """cProfile.Profile with the Python 3.12+ rule: one active profiler per process."""
+
+    _active = None
+    _guard = threading.Lock()
+
+    def enable(self, *args, **kwargs):
+        with ExclusiveProfile._guard:
+            if ExclusiveProfile._active not in (None, self):
+                raise ValueError("Another profiling tool is already active")
+            ExclusiveProfile._active = self
+        super().enable(*args, **kwargs)
+
+    def disable(self):
+        super().disable()
+        with ExclusiveProfile._guard:
+            if ExclusiveProfile._active is self:
+                ExclusiveProfile._active = None
+
+
+@pytest.fixture
+def slow_llm(mock_llm):
+    def responder(messages):
+        time.sleep(0.2)  # A long LLM call on the I/O pool overlaps the other upload
+        system = messages[0]["content"]
+        if "classifier" in system:
+            return json.dumps({"sale": [1]})
+        if "[n, product" in system:
+            return json.dumps({"sales": [[1, "Leite", 2, 5.0, 10.0, "BRL", ""]]})
+        return json.dumps({"remove": [], "errors": [], "fixes": {}})
+
+    return mock_llm(responder)
+
+
+@pytest.mark.parametrize("single_profiler", [False, True], ids=["per-thread", "single"])
+def test_concurrent_profiled_uploads(monkeypatch, tmp_path, slow_llm, single_profiler):
+    if single_profiler:
+        # Emulate Python 3.12+, where a second active profiler raises ValueError
+        monkeypatch.setattr(profiling.cProfile, "Profile", ExclusiveProfile)
+    elif profiling.SINGLE_PROFILER:
+        pytest.skip("per-thread profilers need Python 3.11 or older")
+    monkeypatch.setattr(profiling, "SINGLE_PROFILER", single_profiler)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+
+    async def upload(client, n):
+        chat = f"01/01/2025, 10:0{n} - Ana: vendi {n + 2} leite R$ 5,00\n".encode()
+        return await client.post(
+            "/upload", files={"file": (f"c{n}.txt", chat, "text/plain")}, headers={"X-Profile": "1"}
+        )
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(upload(client, 1), upload(client, 2))
+
+    responses = asyncio.run(run())
+
+    assert [r.status_code for r in responses] == [200, 200]
+    profiles = [r.json()["profile"] for r in responses]
+    if single_profiler:
+        # Only one upload can hold the profiler; the other is timed only
+        assert sorted(p["profiled"] for p in profiles) == [False, True]
+    else:
+        assert all(p["profiled"] for p in profiles)
+    for p in profiles:
+        assert profiling.artifact_path(p["id"])